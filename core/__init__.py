@@ -1,14 +1,19 @@
 __all__ = [
     "init_browser",
+    "launch_browser",
+    "new_context",
     "close_browser",
     "parse_cookie_string",
     "init_db",
     "close_db",
     "insert_image",
     "is_image_exist",
-    "crawl_pinterest_page"
+    "pin_key_from_url",
+    "AsyncImageDB",
+    "crawl_pinterest_page",
+    "crawl_pinterest_pages"
 ]
 
-from .browser_utils import init_browser, close_browser, parse_cookie_string
-from .crawler import crawl_pinterest_page
-from .db_utils import init_db, close_db, insert_image, is_image_exist
+from .browser_utils import init_browser, launch_browser, new_context, close_browser, parse_cookie_string
+from .crawler import crawl_pinterest_page, crawl_pinterest_pages
+from .db_utils import init_db, close_db, insert_image, is_image_exist, pin_key_from_url, AsyncImageDB
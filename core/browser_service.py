@@ -0,0 +1,225 @@
+import asyncio
+import os
+import threading
+
+from dotenv import load_dotenv
+
+from core.browser_utils import launch_browser, new_context, close_browser
+
+# 加载.env文件中的环境变量
+load_dotenv()
+
+__all__ = ['BrowserService']
+
+
+class BrowserService:
+    """
+    常驻浏览器服务：与 Gradio 应用同生命周期，在独立线程的事件循环中维护一个 Chromium，
+    预先创建好已登录的浏览器上下文，采集任务直接领取使用；浏览器崩溃时自动重新启动
+    """
+
+    def __init__(self, logging, warm_contexts=None, health_interval=None):
+        """
+        :param logging: 日志记录器对象
+        :param warm_contexts: 预热的上下文数量，默认读取环境变量 BROWSER_WARM_CONTEXTS
+        :param health_interval: 健康检查间隔（秒），默认读取环境变量 BROWSER_HEALTH_INTERVAL
+        """
+        self.logging = logging
+        self.warm_contexts = warm_contexts if warm_contexts is not None else int(
+            os.getenv('BROWSER_WARM_CONTEXTS', 2))
+        self.health_interval = health_interval or float(os.getenv('BROWSER_HEALTH_INTERVAL', 30))
+        self.loop = None
+        self._thread = None
+        self._started = threading.Event()
+        self._playwright = None
+        self._browser = None
+        self._lock = None
+        self._state_lock = None
+        self._warm = []
+        self._storage_state = None
+        self._storage_mtime = None
+        self._health_task = None
+        # 补充预热池的后台任务，同一时间只有一个
+        self._refill_task = None
+
+    # ====== 线程与事件循环 ======
+    def start(self):
+        """
+        启动事件循环线程和浏览器（重复调用无副作用）
+        """
+        if self._thread is not None:
+            self._started.wait()
+            return self
+        self._thread = threading.Thread(target=self._run_loop, name='browser-service', daemon=True)
+        self._thread.start()
+        self._started.wait()
+        self.run(self._startup())
+        return self
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._lock = asyncio.Lock()
+        self._state_lock = asyncio.Lock()
+        self._started.set()
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """
+        把协程提交到服务的事件循环中执行
+        :return: concurrent.futures.Future
+        """
+        if self._thread is None:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """
+        在服务的事件循环中执行协程并等待结果（供同步代码调用）
+        """
+        return self.submit(coro).result()
+
+    def stop(self):
+        """
+        关闭浏览器并停止事件循环
+        """
+        if self._thread is None:
+            return
+        self.run(self._shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=10)
+        self._thread = None
+
+    # ====== 浏览器生命周期 ======
+    async def _startup(self):
+        await self._ensure_browser()
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _shutdown(self):
+        for task in (self._health_task, self._refill_task):
+            if task is not None:
+                task.cancel()
+        await self._close_browser()
+
+    async def _close_browser(self):
+        for context in self._warm:
+            try:
+                await context.close()
+            except Exception:
+                pass
+        self._warm = []
+        if self._browser is not None:
+            try:
+                await close_browser(self._playwright, self._browser, self.logging)
+            except Exception as e:
+                self.logging.warning(f'关闭浏览器时出错: {e}')
+        self._playwright = None
+        self._browser = None
+
+    def _on_disconnected(self, browser):
+        self.logging.warning('浏览器已断开连接，将在下次使用前重新启动')
+
+    async def _ensure_browser(self):
+        """
+        健康检查：浏览器未启动或已崩溃时重新启动
+        """
+        async with self._lock:
+            if self._browser is not None and self._browser.is_connected():
+                return self._browser
+            if self._browser is not None:
+                self.logging.warning('浏览器不可用，正在重新启动')
+                await self._close_browser()
+            self._playwright, self._browser = await launch_browser(self.logging)
+            self._browser.on('disconnected', self._on_disconnected)
+            self._storage_state = None
+            self.logging.info('常驻浏览器已启动')
+        # 与后台补充共用同一个任务，取消等待方不会中断补充
+        await asyncio.shield(self._start_refill())
+        return self._browser
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self._ensure_browser()
+            except Exception as e:
+                self.logging.error(f'浏览器健康检查失败: {e}')
+
+    # ====== 登录状态与上下文池 ======
+    @staticmethod
+    def _settings_mtime():
+        return os.path.getmtime('setting.json') if os.path.exists('setting.json') else None
+
+    async def _get_storage_state(self):
+        """
+        已登录的存储状态：首次用 setting.json（或环境变量）中的 Cookie 创建上下文后导出并缓存，
+        setting.json 修改后重新生成（同一时间只生成一次）
+        """
+        async with self._state_lock:
+            mtime = self._settings_mtime()
+            if self._storage_state is None or mtime != self._storage_mtime:
+                context = await new_context(self._browser, self.logging)
+                try:
+                    self._storage_state = await context.storage_state()
+                    self._storage_mtime = mtime
+                finally:
+                    await context.close()
+                # 登录状态变化后，之前预热的上下文作废，用新的登录状态重新预热
+                stale, self._warm = self._warm, []
+                for stale_context in stale:
+                    await stale_context.close()
+                self._start_refill()
+            return self._storage_state
+
+    async def _create_context(self):
+        storage_state = await self._get_storage_state()
+        return await new_context(self._browser, self.logging, storage_state=storage_state)
+
+    async def _fill_warm_pool(self):
+        while len(self._warm) < self.warm_contexts:
+            browser = self._browser
+            storage_state = await self._get_storage_state()
+            context = await new_context(browser, self.logging, storage_state=storage_state)
+            if storage_state is not self._storage_state or browser is not self._browser:
+                # 创建期间登录状态变化或浏览器重启，丢弃用旧状态创建的上下文
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+                continue
+            self._warm.append(context)
+
+    async def acquire_context(self):
+        """
+        领取一个已登录的浏览器上下文（优先使用预热的上下文），并在后台补充预热池
+        :return: 浏览器上下文对象
+        """
+        await self._ensure_browser()
+        # 检查登录状态是否变化，变化时会清空预热池
+        await self._get_storage_state()
+        context = self._warm.pop() if self._warm else await self._create_context()
+        self._start_refill()
+        return context
+
+    def _start_refill(self):
+        """
+        在后台补充预热池：已有补充任务在运行时直接返回该任务，避免并发补充超出 warm_contexts
+        """
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill())
+        return self._refill_task
+
+    async def _refill(self):
+        try:
+            await self._fill_warm_pool()
+        except Exception as e:
+            self.logging.warning(f'补充预热上下文失败: {e}')
+
+    async def release_context(self, context):
+        """
+        归还上下文：关闭使用过的上下文，避免不同任务之间相互影响
+        """
+        try:
+            await context.close()
+        except Exception as e:
+            self.logging.debug(f'关闭浏览器上下文时出错: {e}')
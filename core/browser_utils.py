@@ -6,7 +6,12 @@ from dotenv import load_dotenv
 # 加载.env文件中的环境变量
 load_dotenv()
 
-__all__ = ['parse_cookie_string', 'init_browser', 'close_browser']
+__all__ = ['parse_cookie_string', 'load_cookie_string', 'launch_browser', 'new_context', 'block_resources',
+           'init_browser', 'close_browser']
+
+# 默认拦截的统计/广告请求（URL 包含以下关键字）
+DEFAULT_BLOCK_URL_KEYWORDS = ('google-analytics.com', 'googletagmanager.com', 'doubleclick.net',
+                              'ct.pinterest.com', 'trk.pinterest.com', '/_/_/report/', '/v3/callback/event')
 
 
 def parse_cookie_string(cookie_str: str) -> list:
@@ -19,10 +24,38 @@ def parse_cookie_string(cookie_str: str) -> list:
     return cookies
 
 
-async def init_browser(logging):
+def load_cookie_string():
+    """
+    读取 Cookie 字符串：优先使用 setting.json，其次使用环境变量 COOKIE_STRING
+    """
+    if os.path.exists("setting.json"):
+        with open("setting.json", "r") as f:
+            settings = json.load(f)
+        return settings.get("COOKIE_STRING")
+    return os.getenv('COOKIE_STRING')
+
+
+async def launch_browser(logging):
+    """
+    启动 Playwright 和 Chromium
+    :return: (async_playwright 对象, 浏览器对象)
+    """
     p = await async_playwright().__aenter__()  # 手动管理async_playwright的生命周期
     # 启动浏览器，根据环境变量HEADLESS决定是否启用有头模式
     headless = os.getenv('HEADLESS', 'True').lower() == 'true'
+    browser = await p.chromium.launch(headless=headless)
+    logging.debug(f'浏览器已启动，headless={headless}')
+    return p, browser
+
+
+async def new_context(browser, logging, storage_state=None):
+    """
+    创建浏览器上下文：设置 User-Agent、代理、viewport 和登录 Cookie
+    :param browser: 浏览器对象
+    :param logging: 日志记录器对象
+    :param storage_state: 已登录上下文导出的存储状态，传入时直接复用，不再解析 Cookie
+    :return: 浏览器上下文对象
+    """
     # 设置User-Agent和其他浏览器指纹相关参数
     user_agent = os.getenv('USER_AGENT',
                            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
@@ -32,7 +65,6 @@ async def init_browser(logging):
     if os.getenv('PROXY_URL'):
         proxy_settings = ProxySettings(server=os.getenv('PROXY_URL'))
 
-    browser = await p.chromium.launch(headless=headless)
     # 设置 viewport（屏幕宽度和高度）
     viewport_width = int(os.getenv('VIEWPORT_WIDTH', 1920))  # 默认宽度为 1920
     viewport_height = int(os.getenv('VIEWPORT_HEIGHT', 1000))  # 默认高度为 1080
@@ -40,23 +72,55 @@ async def init_browser(logging):
     context = await browser.new_context(
         user_agent=user_agent,
         proxy=proxy_settings,
-        viewport={"width": viewport_width, "height": viewport_height}  # 设置 viewport
+        viewport={"width": viewport_width, "height": viewport_height},  # 设置 viewport
+        storage_state=storage_state
     )
+    # 拦截图片、视频、字体和统计请求，减少浏览器的带宽和 CPU 占用
+    await block_resources(context, logging)
+    if storage_state is not None:
+        return context
 
     # 解析并设置cookies
-    if os.path.exists("setting.json"):
-        with open("setting.json", "r") as f:
-            settings = json.load(f)
-        cookie_str = settings.get("COOKIE_STRING")
-    else:
-        cookie_str = os.getenv('COOKIE_STRING')
-
+    cookie_str = load_cookie_string()
     if cookie_str:
         cookies = parse_cookie_string(cookie_str)
         await context.add_cookies(cookies)
         logging.info('Cookies 设置成功')
     else:
         logging.warning('未找到环境变量中的 COOKIE_STRING')
+    return context
+
+
+async def block_resources(context, logging):
+    """
+    拦截采集用不到的请求：图片、视频、字体和统计请求直接中止，浏览器不再下载原图。
+    DOM 中的 src/srcset 属性不受影响，图片仍由 ImageUtils 下载。
+    读取环境变量 BLOCK_RESOURCES、BLOCK_RESOURCE_TYPES、BLOCK_URL_KEYWORDS
+    :param context: 浏览器上下文对象（对其中所有页面生效）
+    :param logging: 日志记录器对象
+    """
+    if os.getenv('BLOCK_RESOURCES', 'true').lower() != 'true':
+        return
+    resource_types = {t.strip() for t in os.getenv('BLOCK_RESOURCE_TYPES', 'image,media,font').split(',')
+                      if t.strip()}
+    keywords = os.getenv('BLOCK_URL_KEYWORDS')
+    keywords = tuple(k.strip() for k in keywords.split(',') if k.strip()) if keywords is not None \
+        else DEFAULT_BLOCK_URL_KEYWORDS
+
+    async def handle(route):
+        request = route.request
+        if request.resource_type in resource_types or any(k in request.url for k in keywords):
+            await route.abort('blockedbyclient')
+        else:
+            await route.continue_()
+
+    await context.route('**/*', handle)
+    logging.debug(f'已拦截资源类型: {sorted(resource_types)}')
+
+
+async def init_browser(logging):
+    p, browser = await launch_browser(logging)
+    context = await new_context(browser, logging)
 
     # 打开页面
     page = await context.new_page()
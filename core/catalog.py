@@ -0,0 +1,104 @@
+import os
+import threading
+
+from core.db_utils import DB_PATH, init_db, insert_image_meta, query_image_meta, task_id_from_dir
+from core.image_utils import read_image_meta
+from core.thumbnail import IMAGE_EXTENSIONS
+
+__all__ = ['TaskCatalog']
+
+TASK_COLUMNS = ('task_id', 'task_dir', 'url', 'status', 'image_count', 'bytes', 'created_at', 'updated_at',
+                'finished_at')
+
+
+class TaskCatalog:
+    """
+    任务目录查询（供界面使用）：直接分页查询数据库中的 tasks 表，不扫描任务文件夹
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.conn = init_db(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _where(status):
+        return ("WHERE status=?", (status,)) if status else ("", ())
+
+    def count(self, status=None):
+        """
+        :param status: 只统计指定状态的任务（可选）
+        :return: 任务数
+        """
+        where, params = self._where(status)
+        return self._query(f"SELECT COUNT(*) FROM tasks {where}", params)[0][0]
+
+    def page(self, page=1, page_size=20, status=None):
+        """
+        分页查询任务，按创建时间倒序
+        :param page: 页码（从 1 开始）
+        :param page_size: 每页任务数
+        :param status: 只查询指定状态的任务（可选）
+        :return: [任务字典, ...]
+        """
+        where, params = self._where(status)
+        offset = max(0, (int(page) - 1) * int(page_size))
+        rows = self._query(f"SELECT {', '.join(TASK_COLUMNS)} FROM tasks {where} "
+                           f"ORDER BY created_at DESC, task_id DESC LIMIT ? OFFSET ?",
+                           (*params, int(page_size), offset))
+        return [dict(zip(TASK_COLUMNS, row)) for row in rows]
+
+    def get(self, task_id):
+        rows = self._query(f"SELECT {', '.join(TASK_COLUMNS)} FROM tasks WHERE task_id=?", (task_id,))
+        return dict(zip(TASK_COLUMNS, rows[0])) if rows else None
+
+    def latest(self):
+        """
+        :return: 最近创建的任务，没有任务时返回 None
+        """
+        tasks = self.page(1, 1)
+        return tasks[0] if tasks else None
+
+    def _backfill_image_meta(self, task_dir):
+        """
+        本功能上线前采集的任务没有图片元数据：只读取一次文件头补录，之后直接查询数据库
+        """
+        task_id = task_id_from_dir(task_dir)
+        if not os.path.isdir(task_dir) or self._query("SELECT 1 FROM image_meta WHERE task_id=? LIMIT 1", (task_id,)):
+            return
+        rows = []
+        for name in sorted(os.listdir(task_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                meta = read_image_meta(os.path.join(task_dir, name))
+                rows.append((task_id, name, None, meta['width'], meta['height'], meta['format'], meta['bytes'],
+                             meta['aspect']))
+        if rows:
+            with self._lock:
+                insert_image_meta(self.conn, rows)
+
+    def images(self, task_dir, orientation=None, min_width=None, min_height=None, min_side=None, formats=None,
+               limit=None):
+        """
+        按图片元数据（方向、尺寸、格式）筛选任务中的图片，不打开图片文件
+        :param task_dir: 任务文件夹
+        :param orientation: 图片方向（portrait / landscape / square，可选）
+        :param min_width: 最小宽度（像素，可选）
+        :param min_height: 最小高度（像素，可选）
+        :param min_side: 最短边的最小像素（可选）
+        :param formats: 图片格式列表（可选）
+        :param limit: 最多返回的图片数（可选）
+        :return: [图片元数据字典（含 path）, ...]
+        """
+        self._backfill_image_meta(task_dir)
+        with self._lock:
+            rows = query_image_meta(self.conn, task_id_from_dir(task_dir), orientation, min_width, min_height,
+                                    min_side, formats, limit)
+        return [{"path": os.path.join(task_dir, name), "width": width, "height": height, "format": image_format,
+                 "bytes": size, "aspect": aspect} for name, width, height, image_format, size, aspect in rows]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
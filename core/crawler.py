@@ -2,225 +2,401 @@ import asyncio
 import math
 import time
 
-from core.db_utils import is_image_exist, insert_image
 from dotenv import load_dotenv
 import os
 import json
 
+from core.db_utils import pin_key_from_url
+from core.downloader import DownloadPipeline
 from core.image_utils import ImageUtils
+from core.pacing import ScrollPacer
+from core.pin_api import PinResponseCollector, extract_mode
 
 # 加载.env文件中的环境变量
 load_dotenv()
 
-__all__ = ['crawl_pinterest_page']
+__all__ = ['crawl_pinterest_page', 'crawl_pinterest_pages']
 
 
-# async def handle_response(response):
-#     """
-#     处理网络响应，检测特定接口是否加载完成
-#     :param response: 网络响应对象
-#     :param logging: 日志记录器对象
-#     """
-#     if 'RelatedModulesResource/get' in response.url:
-#         logging.debug(f'特定接口加载完成: {response.url}')
-
-
-async def crawl_pinterest_page(conn, page, logging, task_dir, pinterest_url="", collected_page_nums=10,
-                               overwrite_existing=True):
+async def crawl_pinterest_page(db, page, logging, task_dir, pinterest_url="", collected_page_nums=10,
+                               overwrite_existing=True, pipeline=None, checkpoint=None):
     """
    爬取 Pinterest 页面内容
-   :param conn: 数据库连接对象
+   :param db: 异步数据库对象（AsyncImageDB）
    :param page: Playwright 页面对象
    :param logging: 日志记录器对象
    :param task_dir: 任务执行记录文件夹
+   :param pipeline: 采集任务共享的下载流水线（DownloadPipeline），为空时在本次爬取内创建并在结束时等待下载完成
+   :param checkpoint: 断点续采时任务的断点（AsyncImageDB.load_checkpoint），从上次的滚动位置继续
    """
     # 加载设置
     if pinterest_url != "":
         pinterest_url = pinterest_url
 
-    # 打开页面
-    if not page.is_closed():
-        await page.goto(pinterest_url)
-        logging.info('页面加载完成')
-    else:
+    if pipeline is None:
+        async with ImageUtils(os.getenv("PROXY_URL")) as image_util:
+            async with DownloadPipeline(image_util, logging) as pipeline:
+                return await crawl_pinterest_page(db, page, logging, task_dir, pinterest_url, collected_page_nums,
+                                                  overwrite_existing, pipeline, checkpoint)
+
+    if page.is_closed():
         logging.error("页面已关闭，无法导航")
         return
 
-    await asyncio.sleep(5)
-
-    grid_items = await page.query_selector_all('[data-grid-item="true"]')
-    pinrep_videos = await page.query_selector_all('[data-test-id="pinrep-video"]')
-
-    logging.info(f'找到 [data-grid-item="true"] 的个数: {len(grid_items)}')
-    logging.info(f'找到 [data-test-id="pinrep-video"] 的个数: {len(pinrep_videos)}')
-
-    if len(grid_items) > len(pinrep_videos):
-        css_selector = '[data-grid-item="true"]'
-    else:
-        # 如果条件不满足，可以设置一个默认的选择器或处理逻辑
-        css_selector = '[data-test-id="pinrep-video"]'  # 或者其他的默认选择器
-
-    # 第一次加载图片
-    images_div = await page.query_selector_all(css_selector)
-    if len(images_div) == 0:
-        images_div = await page.query_selector_all(css_selector)
-        css_selector = '[data-test-id="non-story-pin-image"]'
-
-    logging.info(f'在页面上找到 {len(images_div)} 个包含图片的 div 元素')
-
-    await process_images(conn, images_div, logging, task_dir, overwrite_existing)
+    # 提取方式：dom 遍历页面元素，api 解析接口响应，both 两者同时使用
+    mode = extract_mode()
+    collector = None
+
+    # 本次采集已处理过的 Pin，每次滚动只处理新出现的 Pin；断点续采时包含上次已处理的 Pin
+    seen = set(checkpoint["seen"]) if checkpoint else set()
+    start_round = checkpoint["pages"].get(pinterest_url, (0, False))[0] if checkpoint else 0
+
+    async def harvest(final=False):
+        """
+        按提取方式收集当前已加载的 Pin 并交给下载流水线
+        :param final: 是否为最后一次收集（暂缓的 Pin 不再等待 srcset）
+        """
+        if mode in ('dom', 'both'):
+            await process_images(db, page, logging, task_dir, overwrite_existing, pipeline, seen, final)
+        if collector is not None:
+            pins = collector.drain()
+            logging.info(f'从接口响应中收集到 {len(pins)} 个新的 Pin')
+            await process_pins(db, pins, logging, task_dir, overwrite_existing, pipeline, seen)
+
+    # 滚动节奏控制：固定等待或根据页面加载情况自适应等待
+    pacer = ScrollPacer(page, logging)
+    pacer.attach()
+    try:
+        if mode in ('api', 'both'):
+            collector = PinResponseCollector(logging)
+            collector.attach(page)
+            logging.info(f'图片链接提取方式: {mode}，监听 Pinterest 资源接口响应')
+
+        # 打开页面
+        await page.goto(pinterest_url)
+        logging.info('页面加载完成')
 
-    # 滚动页面以加载更多内容
-    logging.info('开始滚动页面以加载更多内容...')
-    scroll_count = collected_page_nums  # 滚动次数
-    scroll_distance = int(os.getenv('SCROLL_DISTANCE', 1000))  # 滚动距离
-    scroll_wait_time = int(os.getenv('SCROLL_WAIT_TIME', 5))  # 滚动等待时间
+        await pacer.wait_loaded()
 
-    for i in range(scroll_count):
-        # current_scroll_distance = scroll_distance * (i + 1)
-        # logging.info(f'滚动页面到距离 {current_scroll_distance}px')
-        await page.mouse.wheel(0, scroll_distance)
+        # 第一次加载图片
+        if collector is not None:
+            await collector.harvest_initial_state(page)
+        await harvest()
+        await db.save_checkpoint(task_dir, pinterest_url, start_round)
+
+        # 滚动页面以加载更多内容
+        logging.info('开始滚动页面以加载更多内容...')
+        scroll_count = collected_page_nums  # 滚动次数
+        scroll_distance = int(os.getenv('SCROLL_DISTANCE', 1000))  # 滚动距离
+
+        if start_round:
+            # 断点续采：先滚动到上次停止的位置，期间不提取图片，到达后一次性处理新渲染的 Pin
+            logging.info(f'从断点继续采集，快速滚动 {min(start_round, scroll_count)} 次')
+            for _ in range(min(start_round, scroll_count)):
+                await pacer.scroll(scroll_distance)
+            await harvest()
+
+        for i in range(start_round, scroll_count):
+            # current_scroll_distance = scroll_distance * (i + 1)
+            # logging.info(f'滚动页面到距离 {current_scroll_distance}px')
+            await pacer.scroll(scroll_distance)
+
+            await harvest()
+            await db.save_checkpoint(task_dir, pinterest_url, i + 1)
+            # 当从页面中发现存在“找寻更多点子”的文字元素，则停止循环，和抓取
+
+            # 检查“找寻更多点子”文本是否出现在页面中
+            more_ideas_element = await page.query_selector('h1:has-text("找寻更多点子")')
+            if more_ideas_element:
+                bounding_box = await more_ideas_element.bounding_box()
+                if bounding_box:
+                    element_top = bounding_box['y'] + 2000  # 元素距离页面顶部的高度
+                    current_scroll_position = await page.evaluate("window.scrollY")  # 当前滚动位置
+                    # viewport_height = await page.evaluate("window.innerHeight")  # 视窗高度
+
+                    logging.info(f'元素顶部位置: {element_top}px')
+                    logging.info(f'当前滚动位置: {current_scroll_position}px')
+                    # logging.info(f'视窗高度: {viewport_height}px')
+
+                    # 判断元素是否已在视窗中
+                    if element_top <= current_scroll_position:
+                        logging.info('元素已在视窗中或已滚过该位置')
+                    else:
+                        # 计算还需要滚动的距离
+                        remaining_distance = element_top - current_scroll_position
+                        scroll_distance = int(os.getenv('SCROLL_DISTANCE', 1000))
+                        additional_scrolls_needed = math.ceil(remaining_distance / scroll_distance)
+
+                        logging.info(f'还需滚动距离: {remaining_distance}px')
+                        logging.info(f'还需滚动次数: {additional_scrolls_needed}次')
+                        for _ in range(additional_scrolls_needed):
+                            await pacer.scroll(scroll_distance)
+                            await harvest()
+
+                logging.info('找到“找寻更多点子”文本，停止滚动和抓取。')
+                break
+
+        # 收集仍在等待 srcset 的 Pin
+        await harvest(final=True)
+        await db.save_checkpoint(task_dir, pinterest_url, scroll_count, done=True)
+    finally:
+        # 页面会被下一个 URL 复用，无论采集成功与否都要移除监听
+        pacer.detach()
+        if collector is not None:
+            collector.detach(page)
+    logging.info('滚动和抓取完成。')
 
-        await asyncio.sleep(scroll_wait_time)
-        # page.on('response', handle_response)
 
-        # 判断两个元素的选择器是否存在并比较数量
-        grid_items = await page.query_selector_all('[data-grid-item="true"]')
-        pinrep_videos = await page.query_selector_all('[data-test-id="pinrep-video"]')
+async def crawl_pinterest_pages(db, browser_service, logging, task_dir, pinterest_urls, collected_page_nums=10,
+                                overwrite_existing=True, pipeline=None, contexts=None, pages_per_context=None,
+                                checkpoint=None):
+    """
+    在同一个浏览器中用多个上下文、多个页面并行采集多个 Pinterest 页面，
+    所有页面共享登录状态、数据库写入和下载流水线
+    :param db: 异步数据库对象（AsyncImageDB）
+    :param browser_service: 常驻浏览器服务（BrowserService），提供已登录的浏览器上下文
+    :param logging: 日志记录器对象
+    :param task_dir: 任务执行记录文件夹
+    :param pinterest_urls: 采集页面 URL 列表
+    :param pipeline: 共享的下载流水线
+    :param contexts: 浏览器上下文数量，默认读取环境变量 CRAWL_CONTEXTS
+    :param pages_per_context: 每个上下文同时打开的页面数，默认读取环境变量 CRAWL_PAGES_PER_CONTEXT
+    :param checkpoint: 断点续采时任务的断点，先下载上次未完成的图片，跳过已采集完成的页面
+    """
+    if checkpoint:
+        for url, image_name in checkpoint["pending"]:
+            await pipeline.put(task_dir, url, image_name=image_name)
+        pinterest_urls = [url for url in pinterest_urls if not checkpoint["pages"].get(url, (0, False))[1]]
+        logging.info(f'从断点继续：重新下载 {len(checkpoint["pending"])} 张未完成的图片，'
+                     f'剩余 {len(pinterest_urls)} 个页面待采集')
+        if not pinterest_urls:
+            return
+    contexts = contexts or int(os.getenv('CRAWL_CONTEXTS', 2))
+    pages_per_context = pages_per_context or int(os.getenv('CRAWL_PAGES_PER_CONTEXT', 1))
+    contexts = max(1, min(contexts, len(pinterest_urls)))
+
+    urls = asyncio.Queue()
+    for url in pinterest_urls:
+        urls.put_nowait(url)
+
+    # 采集失败的页面：{url: 异常}，单个页面失败不影响其他页面继续采集
+    errors = {}
+
+    async def page_worker(context, name):
+        page = await context.new_page()
+        try:
+            while not urls.empty():
+                url = urls.get_nowait()
+                logging.info(f'[{name}] 开始采集 {url}')
+                try:
+                    await crawl_pinterest_page(db, page, logging, task_dir, url, collected_page_nums,
+                                               overwrite_existing, pipeline, checkpoint)
+                except Exception as e:
+                    errors[url] = e
+                    logging.error(f'[{name}] 采集 {url} 时出错: {e}')
+        finally:
+            await page.close()
+
+    # 所有上下文复用浏览器服务中缓存的登录状态
+    browser_contexts = []
+    try:
+        for _ in range(contexts):
+            browser_contexts.append(await browser_service.acquire_context())
+        logging.info(f'并行采集 {len(pinterest_urls)} 个页面，浏览器上下文 {len(browser_contexts)} 个，'
+                     f'每个上下文 {pages_per_context} 个页面')
+        await asyncio.gather(*(page_worker(context, f'上下文{i + 1}-页面{j + 1}')
+                               for i, context in enumerate(browser_contexts)
+                               for j in range(pages_per_context)))
+    finally:
+        for context in browser_contexts:
+            await browser_service.release_context(context)
+    if errors:
+        # 有页面采集失败时任务标记为失败，可以从断点继续（已完成的页面会被跳过）
+        raise RuntimeError(f'{len(errors)} / {len(pinterest_urls)} 个页面采集失败：'
+                           + '；'.join(f'{url}（{e}）' for url, e in errors.items()))
+
+
+# 一次 page.evaluate 取回新渲染 Pin 的图片链接，选择器切换逻辑也在页面内完成。
+# 首次调用时在页面中安装 MutationObserver，之后只检查新插入（或 src/srcset 变化）的节点，
+# 已经返回过的 Pin 记录在页面内的 seen 集合中，不会重复返回。
+# 懒加载的 Pin 先只有小图 src，srcset 稍后才出现：没有 srcset 的节点暂缓返回，等 srcset 出现后再取最大尺寸，
+# 连续 SRCSET_WAIT_PASSES 次仍没有 srcset（或节点已被移除）时才使用 src
+SRCSET_WAIT_PASSES = 3
+EXTRACT_PINS_JS = """(srcsetWaitPasses) => {
+    const SELECTORS = ['[data-grid-item="true"]', '[data-test-id="pinrep-video"]', '[data-test-id="non-story-pin-image"]'];
+    let tracker = window.__pinTracker;
+    let roots;
+    if (!tracker) {
+        // inserted / stamps 记录节点的插入序号，滚动节奏控制据此只把滚动之后插入的节点视为新内容
+        tracker = window.__pinTracker = {seen: new Set(), pending: new Set(), deferred: new Map(),
+                                         inserted: 0, stamps: new WeakMap()};
+        tracker.observer = new MutationObserver(records => {
+            for (const record of records) {
+                if (record.type === 'attributes') {
+                    tracker.pending.add(record.target);
+                    continue;
+                }
+                for (const node of record.addedNodes) {
+                    if (node.nodeType !== Node.ELEMENT_NODE) continue;
+                    tracker.stamps.set(node, ++tracker.inserted);
+                    tracker.pending.add(node);
+                }
+            }
+        });
+        tracker.observer.observe(document.body, {
+            childList: true, subtree: true, attributes: true, attributeFilter: ['src', 'srcset'],
+        });
+        roots = [document.body];
+    } else {
+        roots = Array.from(tracker.pending);
+    }
+    tracker.pending.clear();
+
+    const gridItems = document.querySelectorAll(SELECTORS[0]).length;
+    const pinrepVideos = document.querySelectorAll(SELECTORS[1]).length;
+    let selector = gridItems >= pinrepVideos ? SELECTORS[0] : SELECTORS[1];
+    if (gridItems === 0 && pinrepVideos === 0) selector = SELECTORS[2];
+
+    const nodes = new Set();
+    for (const root of roots) {
+        if (!root.isConnected) continue;
+        const container = root.closest(selector);
+        if (container) {
+            nodes.add(container);
+            continue;
+        }
+        for (const node of root.querySelectorAll(selector)) nodes.add(node);
+    }
+    for (const node of tracker.deferred.keys()) nodes.add(node);
+
+    const items = [];
+    for (const node of nodes) {
+        const img = node.querySelector('img');
+        if (!img) continue;
+        const src = img.getAttribute('src');
+        const srcset = img.getAttribute('srcset');
+        if (!src && !srcset) continue;
+        const link = node.closest('a[href*="/pin/"]') || node.querySelector('a[href*="/pin/"]');
+        const match = link ? link.getAttribute('href').match(/\\/pin\\/([^/?#]+)/) : null;
+        const pinId = match ? match[1] : null;
+        const key = pinId || (srcset ? srcset.split(',').pop().trim().split(' ')[0] : src);
+        if (tracker.seen.has(key)) {
+            tracker.deferred.delete(node);
+            continue;
+        }
+        if (!srcset) {
+            const passes = (tracker.deferred.get(node) || 0) + 1;
+            if (node.isConnected && passes < srcsetWaitPasses) {
+                tracker.deferred.set(node, passes);
+                continue;
+            }
+        }
+        tracker.deferred.delete(node);
+        tracker.seen.add(key);
+        items.push({src, srcset, pin_id: pinId});
+    }
+    return {gridItems, pinrepVideos, selector, nodes: nodes.size, items};
+}"""
+
+
+def parse_srcset(srcset):
+    """
+    解析 img 的 srcset 属性
+    :param srcset: 形如 "url1 1x, url2 2x" 的字符串
+    :return: [{"url", "scale", "width", "height"}, ...]，最大尺寸在最后
+    """
+    variants = []
+    for entry in srcset.split(','):
+        parts = entry.strip().split(' ')
+        if parts and parts[0]:
+            variants.append({"url": parts[0], "scale": parts[-1] if len(parts) > 1 else None,
+                             "width": None, "height": None})
+    return variants
 
-        logging.info(f'找到 [data-grid-item="true"] 的个数: {len(grid_items)}')
-        logging.info(f'找到 [data-test-id="pinrep-video"] 的个数: {len(pinrep_videos)}')
 
-        if len(grid_items) >= len(pinrep_videos):
-            css_selector = '[data-grid-item="true"]'
-            images_div = grid_items
+async def extract_dom_pins(page, logging, final=False):
+    """
+    批量读取页面上新渲染的 Pin 元素的 src、srcset 和 pin id，只需一次浏览器往返
+    :param page: Playwright 页面对象
+    :param logging: 日志记录器对象
+    :param final: 是否为最后一次读取，是则暂缓的 Pin 直接使用 src
+    :return: [{"pin_id", "variants"}, ...]
+    """
+    result = await page.evaluate(EXTRACT_PINS_JS, 1 if final else SRCSET_WAIT_PASSES)
+    logging.info(f'找到 [data-grid-item="true"] 的个数: {result["gridItems"]}')
+    logging.info(f'找到 [data-test-id="pinrep-video"] 的个数: {result["pinrepVideos"]}')
+    logging.info(f'页面上新渲染 {result["nodes"]} 个包含图片的 div 元素（{result["selector"]}），'
+                 f'其中新的 Pin {len(result["items"])} 个')
+
+    pins = []
+    for item in result["items"]:
+        if item["srcset"]:
+            variants = parse_srcset(item["srcset"])
+        elif item["src"]:
+            variants = [{"url": item["src"], "scale": None, "width": None, "height": None}]
         else:
-            # 如果条件不满足，可以设置一个默认的选择器或处理逻辑
-            css_selector = '[data-test-id="pinrep-video"]'  # 或者其他的默认选择器
-            images_div = pinrep_videos
-        # 第一次加载图片
+            continue
+        pins.append({"pin_id": item["pin_id"], "variants": variants})
+    return pins
 
-        if len(images_div) == 0:
-            css_selector = '[data-test-id="non-story-pin-image"]'
-            new_images_div = await page.query_selector_all(css_selector)
-        else:
-            new_images_div = images_div
-
-        logging.info(f'在在页面上找到 {len(new_images_div)} 个包含图片的 div 元素')
-        await process_images(conn, new_images_div, logging, task_dir, overwrite_existing)
-        # 当从页面中发现存在“找寻更多点子”的文字元素，则停止循环，和抓取
-
-        # 检查“找寻更多点子”文本是否出现在页面中
-        more_ideas_element = await page.query_selector('h1:has-text("找寻更多点子")')
-        if more_ideas_element:
-            bounding_box = await more_ideas_element.bounding_box()
-            if bounding_box:
-                element_top = bounding_box['y'] + 2000  # 元素距离页面顶部的高度
-                current_scroll_position = await page.evaluate("window.scrollY")  # 当前滚动位置
-                # viewport_height = await page.evaluate("window.innerHeight")  # 视窗高度
-
-                logging.info(f'元素顶部位置: {element_top}px')
-                logging.info(f'当前滚动位置: {current_scroll_position}px')
-                # logging.info(f'视窗高度: {viewport_height}px')
-
-                # 判断元素是否已在视窗中
-                if element_top <= current_scroll_position:
-                    logging.info('元素已在视窗中或已滚过该位置')
-                else:
-                    # 计算还需要滚动的距离
-                    remaining_distance = element_top - current_scroll_position
-                    scroll_distance = int(os.getenv('SCROLL_DISTANCE', 1000))
-                    additional_scrolls_needed = math.ceil(remaining_distance / scroll_distance)
-
-                    logging.info(f'还需滚动距离: {remaining_distance}px')
-                    logging.info(f'还需滚动次数: {additional_scrolls_needed}次')
-                    for _ in range(additional_scrolls_needed):
-                        await page.mouse.wheel(0, scroll_distance)
-                        await asyncio.sleep(scroll_wait_time)
-                        grid_items = await page.query_selector_all('[data-grid-item="true"]')
-                        pinrep_videos = await page.query_selector_all('[data-test-id="pinrep-video"]')
-
-                        logging.info(f'找到 [data-grid-item="true"] 的个数: {len(grid_items)}')
-                        logging.info(f'找到 [data-test-id="pinrep-video"] 的个数: {len(pinrep_videos)}')
-
-                        if len(grid_items) >= len(pinrep_videos):
-                            css_selector = '[data-grid-item="true"]'
-                            images_div = grid_items
-                        else:
-                            # 如果条件不满足，可以设置一个默认的选择器或处理逻辑
-                            css_selector = '[data-test-id="pinrep-video"]'  # 或者其他的默认选择器
-                            images_div = pinrep_videos
-                        # 第一次加载图片
-
-                        if len(images_div) == 0:
-                            css_selector = '[data-test-id="non-story-pin-image"]'
-                            new_images_div = await page.query_selector_all(css_selector)
-                        else:
-                            new_images_div = images_div
-
-                        await process_images(conn, new_images_div, logging, task_dir, overwrite_existing)
-
-            logging.info('找到“找寻更多点子”文本，停止滚动和抓取。')
-            break
 
-    logging.info('滚动和抓取完成。')
+async def process_images(db, page, logging, task_dir, overwrite_existing, pipeline, seen=None, final=False):
+    """
+    批量提取页面上的图片链接并交给 process_pins 处理
+    :param db: 异步数据库对象（AsyncImageDB）
+    :param page: Playwright 页面对象
+    :param logging: 日志记录器对象
+    :param task_dir:任务文件夹
+    :param overwrite_existing: 已采集过的图片是否重复下载
+    :param pipeline: 下载流水线
+    :param seen: 本次采集已处理过的 Pin 集合
+    :param final: 是否为最后一次提取（见 extract_dom_pins）
+    """
+    pins = await extract_dom_pins(page, logging, final)
+    await process_pins(db, pins, logging, task_dir, overwrite_existing, pipeline, seen)
 
 
-async def process_images(conn, images_div, logging, task_dir, overwrite_existing):
+async def process_pins(db, pins, logging, task_dir, overwrite_existing, pipeline, seen=None):
     """
-    处理图片元素并保存到数据库
-    :param conn: 数据库连接对象
-    :param images_div: 包含图片的 div 元素列表
+    处理 Pin 的图片链接：按图片哈希批量查询是否采集过，批量写入数据库并把最大尺寸的图片放入下载队列
+    :param db: 异步数据库对象（AsyncImageDB）
+    :param pins: [{"pin_id", "variants"}, ...]，variants 按尺寸从小到大排列
     :param logging: 日志记录器对象
-    :param task_dir:任务文件夹
+    :param task_dir: 任务文件夹
+    :param overwrite_existing: 已采集过的图片是否重复下载
+    :param pipeline: 下载流水线
+    :param seen: 本次采集已处理过的 Pin 集合（pin id 和图片哈希），命中的 Pin 直接跳过，不再查询数据库
     """
-    for i, div in enumerate(images_div):
-        img = await div.query_selector('img')
-        logging.debug(f'img {i + 1} 的链接: {img}')
-        if img:
-            logging.debug(f'img {i + 1} 的DOM结构: {await img.evaluate("element => element.outerHTML")}')
-            srcset = await img.get_attribute('srcset')
-            src = await img.get_attribute('src')
-
-            if srcset:
-                entries = srcset.split(',')
-                image_urls = [entry.strip().split(' ') for entry in entries]
-                max_image = image_urls[-1][0]
-
-                row = is_image_exist(conn, image_urls[-1][0])
-                image_name = image_urls[-1][0].split("/")[-1]
-                if row is None or overwrite_existing:
-                    for url, scale in image_urls:
-                        insert_image(conn, url, task_dir, scale)
-                    image_util = ImageUtils(os.getenv("PROXY_URL"))
-                    logging.info(f'图片 {i + 1},尺寸最大{image_urls[-1][-1]} 的链接: {image_urls[-1][0]}')
-                    await image_util.download_and_resize_image(
-                        task_dir,
-                        logging,
-                        max_image,
-                        image_name=image_name  # 使用时间戳和序号作为图片名称
-                    )
-                else:
-                    logging.info(
-                        f'图片 {image_name}\n已经在任务:“{os.path.basename(row[1])}”文件夹采集过')
-            else:
-                logging.debug(f'图片 {i + 1} 没有可用的srcset属性')
-                row = is_image_exist(conn, src)
-                image_name = src.split("/")[-1]
-                if src:
-                    if row is None or overwrite_existing:
-                        image_util = ImageUtils(os.getenv("PROXY_URL"))
-                        insert_image(conn, src, task_dir)
-                        await image_util.download_and_resize_image(
-                            task_dir,
-                            logging,
-                            src,
-                            image_name=image_name  # 使用时间戳和序号作为图片名称
-                        )
-                    else:
-                        logging.info(f'图片 {image_name}已经在任务目录“{os.path.basename(row[1])}”下载过')
-                else:
-                    logging.debug(f'img Dom结构：{img}')
+    candidates = []
+    for pin in pins:
+        variants = pin["variants"]
+        if not variants:
+            continue
+        pin_key = pin_key_from_url(variants[-1]["url"])
+
+        if seen is not None:
+            if pin_key in seen or (pin["pin_id"] and pin["pin_id"] in seen):
+                continue
+            seen.add(pin_key)
+            if pin["pin_id"]:
+                seen.add(pin["pin_id"])
+        candidates.append((pin_key, pin))
+
+    if not candidates:
+        return
 
+    existing = await db.exists_many([pin_key for pin_key, _ in candidates])
+    for i, (pin_key, pin) in enumerate(candidates):
+        variants = pin["variants"]
+        max_image = variants[-1]["url"]
+        image_name = max_image.split("/")[-1]
+        if pin_key not in existing or overwrite_existing:
+            await db.add(pin_key, pin["pin_id"], task_dir,
+                         [(v["url"], v["scale"], v["width"], v["height"]) for v in variants])
+            await db.journal(task_dir, pin_key, max_image, image_name)
+            logging.info(f'图片 {i + 1},尺寸最大{variants[-1]["scale"]} 的链接: {max_image}')
+            await pipeline.put(task_dir, max_image, image_name=image_name)
         else:
-            logging.debug(f'div {i + 1} 中没有找到 img 元素')
+            await db.journal(task_dir, pin_key, max_image, image_name, downloaded=True)
+            logging.info(
+                f'图片 {image_name}\n已经在任务:“{os.path.basename(existing[pin_key])}”文件夹采集过')
@@ -1,31 +1,713 @@
+import asyncio
 import os
+import re
 import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 
-__all__ = ['init_db', 'is_image_exist', 'insert_image', 'close_db']
+from dotenv import load_dotenv
 
+from core.thumbnail import IMAGE_EXTENSIONS
 
-def init_db():
-    if not os.path.exists('db'):
-        os.makedirs('db')
-    conn = sqlite3.connect('db/pinterest_images.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS images
-                 (url TEXT PRIMARY KEY, scale TEXT,task_dir TEXT)''')
+# 加载.env文件中的环境变量
+load_dotenv()
+
+__all__ = ['init_db', 'is_image_exist', 'insert_image', 'close_db', 'pin_key_from_url', 'task_root', 'AsyncImageDB']
+
+DB_PATH = 'db/pinterest_images.db'
+# 项目根目录（pin_app.py 所在目录），相对路径的 TASK_DIR 以此为准，与启动时的工作目录无关
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# SQLite 单条语句的参数个数上限较低，批量查询时分段执行
+IN_CHUNK_SIZE = 500
+# 数据库结构版本（PRAGMA user_version）
+# 0: 旧版 images(url, scale, task_dir) 单表
+# 1: tasks / pins / variants 规范化结构
+# 2: pins 增加感知哈希 dhash 和近似重复标记 dup_of
+# 3: tasks 增加任务目录所需的 status / image_count / bytes / updated_at / finished_at
+# 4: 按 TASK_DIR 下的任务文件夹补录任务的创建时间、图片数和字节数
+SCHEMA_VERSION = 4
+# 任务文件夹名称的时间格式（任务 ID）
+TASK_ID_FORMAT = '%Y年%m月%d日%H时%M分%S秒'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    task_dir TEXT NOT NULL,
+    url TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    status TEXT DEFAULT 'done',
+    image_count INTEGER DEFAULT 0,
+    bytes INTEGER DEFAULT 0,
+    updated_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks(created_at);
+CREATE TABLE IF NOT EXISTS pins (
+    pin_key TEXT PRIMARY KEY,
+    pin_id TEXT,
+    task_id TEXT NOT NULL REFERENCES tasks(task_id),
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    dhash INTEGER,
+    dup_of TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_pins_task ON pins(task_id);
+CREATE TABLE IF NOT EXISTS variants (
+    pin_key TEXT NOT NULL REFERENCES pins(pin_key),
+    url TEXT NOT NULL,
+    scale TEXT,
+    width INTEGER,
+    height INTEGER,
+    PRIMARY KEY (pin_key, url)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    params TEXT NOT NULL,
+    task_dir TEXT,
+    done INTEGER DEFAULT 0,
+    failed INTEGER DEFAULT 0,
+    message TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, job_id);
+CREATE TABLE IF NOT EXISTS crawl_checkpoints (
+    task_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    scroll_round INTEGER DEFAULT 0,
+    done INTEGER DEFAULT 0,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (task_id, url)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS crawl_journal (
+    task_id TEXT NOT NULL,
+    pin_key TEXT NOT NULL,
+    url TEXT,
+    image_name TEXT,
+    downloaded INTEGER DEFAULT 0,
+    PRIMARY KEY (task_id, pin_key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS pick_verdicts (
+    content_hash TEXT NOT NULL,
+    criteria TEXT NOT NULL,
+    model_id TEXT NOT NULL,
+    score REAL,
+    verdict TEXT NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    used_at REAL,
+    PRIMARY KEY (content_hash, criteria, model_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_pick_verdicts_used ON pick_verdicts(used_at);
+CREATE TABLE IF NOT EXISTS image_meta (
+    task_id TEXT NOT NULL,
+    image_name TEXT NOT NULL,
+    pin_key TEXT,
+    width INTEGER,
+    height INTEGER,
+    format TEXT,
+    bytes INTEGER,
+    aspect REAL,
+    PRIMARY KEY (task_id, image_name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_image_meta_aspect ON image_meta(task_id, aspect);
+'''
+
+# AsyncImageDB 缓冲区的批量写入语句，flush 时在一个事务中执行
+ADD_TASK_STATS_SQL = ("UPDATE tasks SET image_count=image_count+?, bytes=bytes+?, updated_at=CURRENT_TIMESTAMP "
+                      "WHERE task_id=?")
+INSERT_PINS_SQL = "INSERT OR IGNORE INTO pins (pin_key, pin_id, task_id) VALUES (?, ?, ?)"
+INSERT_VARIANTS_SQL = "INSERT OR IGNORE INTO variants (pin_key, url, scale, width, height) VALUES (?, ?, ?, ?, ?)"
+UPDATE_HASHES_SQL = "UPDATE pins SET dhash=?, dup_of=? WHERE pin_key=?"
+INSERT_JOURNAL_SQL = ("INSERT OR IGNORE INTO crawl_journal (task_id, pin_key, url, image_name, downloaded) "
+                      "VALUES (?, ?, ?, ?, ?)")
+MARK_DOWNLOADED_SQL = "UPDATE crawl_journal SET downloaded=1 WHERE task_id=? AND pin_key=?"
+INSERT_IMAGE_META_SQL = ("INSERT OR REPLACE INTO image_meta (task_id, image_name, pin_key, width, height, format, "
+                         "bytes, aspect) VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+DELETE_IMAGE_META_SQL = "DELETE FROM image_meta WHERE task_id=? AND image_name=?"
+
+# pinimg 图片路径中的文件名是图片内容的哈希，不同尺寸、不同 CDN 路径下保持一致
+# 例如 https://i.pinimg.com/736x/bb/19/8c/bb198c05ec2c07221c7be8d5ab696694.jpg
+PINIMG_HASH_RE = re.compile(r'^([0-9a-f]{16,64})(?:\.\w+)?$', re.IGNORECASE)
+
+
+def pin_key_from_url(url):
+    """
+    从图片 URL 中提取规范化的 Pin 主键（pinimg 路径中的图片哈希）
+    :param url: 图片 URL
+    :return: 图片哈希；非 pinimg 格式的链接返回去掉尺寸目录后的路径
+    """
+    path = urlparse(url).path
+    name = path.rsplit('/', 1)[-1]
+    match = PINIMG_HASH_RE.match(name)
+    if match:
+        return match.group(1).lower()
+    # 去掉第一级的尺寸目录（236x、originals 等）
+    parts = path.strip('/').split('/', 1)
+    return parts[-1] or url
+
+
+def task_root():
+    """
+    任务文件夹的上级目录：环境变量 TASK_DIR，相对路径按项目根目录解析
+    """
+    return os.path.join(PROJECT_DIR, os.getenv('TASK_DIR', 'tasks'))
+
+
+def task_id_from_dir(task_dir):
+    return os.path.basename(os.path.normpath(task_dir))
+
+
+def configure_connection(conn):
+    """
+    设置数据库连接参数：WAL 日志模式，降低提交时的 fsync 次数，读写互不阻塞
+    :param conn: 数据库连接对象
+    """
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-20000')
+    conn.execute('PRAGMA busy_timeout=5000')
+
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def add_columns(conn, table, columns):
+    """
+    为已存在的表补充新增的列
+    :param columns: [(列名, 类型), ...]
+    """
+    existing = table_columns(conn, table)
+    for name, column_type in columns:
+        if name not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+
+
+def migrate_db(conn):
+    """
+    按 PRAGMA user_version 逐步升级数据库结构
+    - 0 -> 1：把旧版 images 表中的记录迁移到 tasks / pins / variants 表，迁移完成后删除 images 表
+    - 1 -> 2：pins 表增加 dhash、dup_of 列
+    - 2 -> 3：tasks 表增加任务目录列，已有任务的图片数按 pins 表估算
+    - 3 -> 4：按 TASK_DIR 下的任务文件夹补录任务，创建时间取自文件夹名称，图片数和字节数按文件夹统计
+    :param conn: 数据库连接对象
+    """
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    with conn:
+        if version < 1:
+            migrate_images_table(conn)
+        if version < 2:
+            add_columns(conn, 'pins', [('dhash', 'INTEGER'), ('dup_of', 'TEXT')])
+        if version < 3:
+            add_columns(conn, 'tasks', [('status', "TEXT DEFAULT 'done'"), ('image_count', 'INTEGER DEFAULT 0'),
+                                        ('bytes', 'INTEGER DEFAULT 0'), ('updated_at', 'TEXT'),
+                                        ('finished_at', 'TEXT')])
+            conn.execute("UPDATE tasks SET image_count=(SELECT COUNT(*) FROM pins WHERE pins.task_id=tasks.task_id)")
+        if version < 4:
+            backfill_task_folders(conn, task_root())
+        conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+
+
+def migrate_images_table(conn):
+    """
+    把旧版 images 表中的记录迁移到 tasks / pins / variants 表，迁移完成后删除 images 表
+    :param conn: 数据库连接对象
+    """
+    has_images = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='images'").fetchone()
+    if has_images:
+        rows = conn.execute('SELECT url, scale, task_dir FROM images ORDER BY rowid').fetchall()
+        conn.executemany('INSERT OR IGNORE INTO tasks (task_id, task_dir) VALUES (?, ?)',
+                         {(task_id_from_dir(task_dir), task_dir) for _, _, task_dir in rows if task_dir})
+        conn.executemany('INSERT OR IGNORE INTO pins (pin_key, task_id) VALUES (?, ?)',
+                         [(pin_key_from_url(url), task_id_from_dir(task_dir)) for url, _, task_dir in rows
+                          if task_dir])
+        conn.executemany('INSERT OR IGNORE INTO variants (pin_key, url, scale) VALUES (?, ?, ?)',
+                         [(pin_key_from_url(url), url, scale) for url, scale, task_dir in rows if task_dir])
+        conn.execute('DROP TABLE images')
+
+
+def task_created_at(task_dir):
+    """
+    任务创建时间：由文件夹名称（本地时间）解析，名称不是任务 ID 格式时使用文件夹的修改时间
+    :return: 与 CURRENT_TIMESTAMP 相同格式的 UTC 时间字符串
+    """
+    try:
+        timestamp = time.mktime(time.strptime(task_id_from_dir(task_dir), TASK_ID_FORMAT))
+    except ValueError:
+        timestamp = os.path.getmtime(task_dir)
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(timestamp))
+
+
+def backfill_task_folders(conn, task_root):
+    """
+    按任务文件夹补录任务目录（只在升级数据库时执行一次）：未登记的任务新增记录，
+    已登记的任务以文件夹名称中的时间为创建时间，图片数和字节数以文件夹中的图片为准
+    :param conn: 数据库连接对象
+    :param task_root: 任务文件夹的上级目录（TASK_DIR）
+    """
+    if not os.path.isdir(task_root):
+        return
+    rows = []
+    for entry in os.scandir(task_root):
+        if not entry.is_dir():
+            continue
+        sizes = [image.stat().st_size for image in os.scandir(entry.path)
+                 if image.is_file() and image.name.lower().endswith(IMAGE_EXTENSIONS)]
+        task_dir = os.path.abspath(entry.path)
+        rows.append((task_id_from_dir(task_dir), task_dir, task_created_at(task_dir), len(sizes), sum(sizes)))
+    conn.executemany("INSERT INTO tasks (task_id, task_dir, created_at, image_count, bytes) VALUES (?, ?, ?, ?, ?) "
+                     "ON CONFLICT(task_id) DO UPDATE SET created_at=excluded.created_at, "
+                     "image_count=excluded.image_count, bytes=excluded.bytes", rows)
+
+
+def init_db(db_path=DB_PATH, check_same_thread=True):
+    db_dir = os.path.dirname(db_path)
+    if db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir)
+    conn = sqlite3.connect(db_path, check_same_thread=check_same_thread)
+    configure_connection(conn)
+    conn.executescript(SCHEMA)
+    migrate_db(conn)
     conn.commit()
     return conn
 
 
 def is_image_exist(conn, url):
+    """
+    查询图片是否已经采集过
+    :return: (pin_key, task_dir)，未采集过返回 None
+    """
     c = conn.cursor()
-    c.execute("SELECT url,task_dir  FROM images WHERE url=?", (url,))
+    c.execute("SELECT p.pin_key, t.task_dir FROM pins p JOIN tasks t ON t.task_id = p.task_id WHERE p.pin_key=?",
+              (pin_key_from_url(url),))
     return c.fetchone()
 
 
+def insert_task(conn, task_dir, url=None, status=None):
+    """
+    登记采集任务
+    :param conn: 数据库连接对象
+    :param task_dir: 任务文件夹
+    :param url: 采集页面地址
+    :param status: 任务状态，任务已存在时（断点续采）更新状态；为空时只登记不存在的任务
+    """
+    with conn:
+        if status is None:
+            conn.execute("INSERT OR IGNORE INTO tasks (task_id, task_dir, url) VALUES (?, ?, ?)",
+                         (task_id_from_dir(task_dir), task_dir, url))
+            return
+        conn.execute("INSERT INTO tasks (task_id, task_dir, url, status, updated_at) "
+                     "VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP) "
+                     "ON CONFLICT(task_id) DO UPDATE SET status=excluded.status, finished_at=NULL, "
+                     "updated_at=CURRENT_TIMESTAMP",
+                     (task_id_from_dir(task_dir), task_dir, url, status))
+
+
+def add_task_stats(conn, rows):
+    """
+    累加任务的图片数和字节数
+    :param rows: [(图片数增量, 字节数增量, task_id), ...]
+    """
+    with conn:
+        conn.executemany(ADD_TASK_STATS_SQL, rows)
+
+
+def finish_task(conn, task_id, status, image_count=None, total_bytes=None):
+    """
+    记录任务结束状态，传入图片数和字节数时以实际统计结果为准
+    """
+    with conn:
+        conn.execute("UPDATE tasks SET status=?, image_count=COALESCE(?, image_count), bytes=COALESCE(?, bytes), "
+                     "updated_at=CURRENT_TIMESTAMP, finished_at=CURRENT_TIMESTAMP WHERE task_id=?",
+                     (status, image_count, total_bytes, task_id))
+
+
 def insert_image(conn, url, task_dir, scale=None, ):
-    c = conn.cursor()
-    c.execute("INSERT OR IGNORE INTO images (url, scale,task_dir) VALUES (?, ?,?)", (url, scale, task_dir))
-    conn.commit()
+    insert_task(conn, task_dir)
+    insert_pins(conn, [((pin_key_from_url(url), None, task_id_from_dir(task_dir)), [(url, scale, None, None)])])
+
+
+def pins_exist(conn, pin_keys):
+    """
+    批量查询 Pin 是否已经采集过
+    :param conn: 数据库连接对象
+    :param pin_keys: Pin 主键列表
+    :return: {pin_key: task_dir}，只包含已存在的 Pin
+    """
+    pin_keys = list(dict.fromkeys(pin_keys))
+    found = {}
+    for i in range(0, len(pin_keys), IN_CHUNK_SIZE):
+        chunk = pin_keys[i:i + IN_CHUNK_SIZE]
+        placeholders = ','.join('?' * len(chunk))
+        rows = conn.execute(f"SELECT p.pin_key, t.task_dir FROM pins p JOIN tasks t ON t.task_id = p.task_id "
+                            f"WHERE p.pin_key IN ({placeholders})", chunk)
+        found.update(rows.fetchall())
+    return found
+
+
+def insert_pins(conn, pins):
+    """
+    在一个事务中批量写入 Pin 及其各尺寸图片
+    :param conn: 数据库连接对象
+    :param pins: [((pin_key, pin_id, task_id), [(url, scale, width, height), ...]), ...]
+    """
+    with conn:
+        write_pins(conn, pins)
+
+
+def write_pins(conn, pins):
+    """
+    写入 Pin 及其各尺寸图片（不提交，由调用方管理事务）
+    :param pins: 格式见 insert_pins
+    """
+    conn.executemany(INSERT_PINS_SQL, [pin for pin, _ in pins])
+    conn.executemany(INSERT_VARIANTS_SQL, [(pin[0],) + variant for pin, variants in pins for variant in variants])
+
+
+def update_hashes(conn, rows):
+    """
+    批量记录图片的感知哈希
+    :param conn: 数据库连接对象
+    :param rows: [(dhash, dup_of, pin_key), ...]
+    """
+    with conn:
+        conn.executemany(UPDATE_HASHES_SQL, rows)
+
+
+def load_hashes(conn):
+    """
+    读取所有非重复图片的感知哈希
+    :return: [(pin_key, dhash), ...]
+    """
+    return conn.execute("SELECT pin_key, dhash FROM pins WHERE dhash IS NOT NULL AND dup_of IS NULL").fetchall()
+
+
+def insert_journal(conn, rows):
+    """
+    记录采集任务已处理的 Pin（断点续采日志）
+    :param conn: 数据库连接对象
+    :param rows: [(task_id, pin_key, url, image_name, downloaded), ...]，downloaded 为 0 表示待下载
+    """
+    with conn:
+        conn.executemany(INSERT_JOURNAL_SQL, rows)
+
+
+def mark_downloaded(conn, rows):
+    """
+    标记断点续采日志中的图片已下载
+    :param rows: [(task_id, pin_key), ...]
+    """
+    with conn:
+        conn.executemany(MARK_DOWNLOADED_SQL, rows)
+
+
+def save_checkpoint(conn, task_id, url, scroll_round, done=False):
+    """
+    记录采集页面的滚动进度
+    :param task_id: 任务 ID
+    :param url: 采集页面地址
+    :param scroll_round: 已完成的滚动次数
+    :param done: 页面是否已采集完成
+    """
+    with conn:
+        conn.execute("INSERT INTO crawl_checkpoints (task_id, url, scroll_round, done) VALUES (?, ?, ?, ?) "
+                     "ON CONFLICT(task_id, url) DO UPDATE SET scroll_round=excluded.scroll_round, "
+                     "done=excluded.done, updated_at=CURRENT_TIMESTAMP",
+                     (task_id, url, scroll_round, int(done)))
+
+
+def load_checkpoint(conn, task_id):
+    """
+    读取采集任务的断点
+    :return: {"pages": {url: (滚动次数, 是否完成)}, "seen": {pin_key, ...}, "pending": [(url, image_name), ...]}
+    """
+    pages = {url: (scroll_round, bool(done)) for url, scroll_round, done in conn.execute(
+        "SELECT url, scroll_round, done FROM crawl_checkpoints WHERE task_id=?", (task_id,))}
+    seen = set()
+    pending = []
+    for pin_key, url, image_name, downloaded in conn.execute(
+            "SELECT pin_key, url, image_name, downloaded FROM crawl_journal WHERE task_id=?", (task_id,)):
+        seen.add(pin_key)
+        if not downloaded:
+            pending.append((url, image_name))
+    return {"pages": pages, "seen": seen, "pending": pending}
+
+
+# 图片方向对应的宽高比范围（宽 / 高），接近 1 的视为方图
+ORIENTATIONS = {
+    'portrait': ('aspect < ?', 0.95),
+    'landscape': ('aspect > ?', 1.05),
+    'square': ('aspect BETWEEN ? AND ?', 0.95, 1.05),
+}
+
+
+def insert_image_meta(conn, rows):
+    """
+    记录下载图片的元数据
+    :param rows: [(task_id, image_name, pin_key, width, height, format, bytes, aspect), ...]
+    """
+    with conn:
+        conn.executemany(INSERT_IMAGE_META_SQL, rows)
+
+
+def delete_image_meta(conn, rows):
+    """
+    删除图片的元数据（近似重复图片被删除时）
+    :param rows: [(task_id, image_name), ...]
+    """
+    with conn:
+        conn.executemany(DELETE_IMAGE_META_SQL, rows)
+
+
+def query_image_meta(conn, task_id, orientation=None, min_width=None, min_height=None, min_side=None,
+                     formats=None, limit=None):
+    """
+    按元数据筛选任务中的图片
+    :param task_id: 任务 ID
+    :param orientation: 图片方向（portrait / landscape / square，可选）
+    :param min_width: 最小宽度（像素，可选）
+    :param min_height: 最小高度（像素，可选）
+    :param min_side: 最短边的最小像素（可选）
+    :param formats: 图片格式列表（jpeg / png / gif / webp，可选）
+    :param limit: 最多返回的图片数（可选）
+    :return: [(image_name, width, height, format, bytes, aspect), ...]
+    """
+    where = ["task_id=?"]
+    params = [task_id]
+    if orientation:
+        condition, *values = ORIENTATIONS[orientation]
+        where.append(condition)
+        params.extend(values)
+    if min_width:
+        where.append("width >= ?")
+        params.append(int(min_width))
+    if min_height:
+        where.append("height >= ?")
+        params.append(int(min_height))
+    if min_side:
+        where.append("MIN(width, height) >= ?")
+        params.append(int(min_side))
+    if formats:
+        where.append(f"format IN ({','.join('?' * len(formats))})")
+        params.extend(formats)
+    sql = (f"SELECT image_name, width, height, format, bytes, aspect FROM image_meta "
+           f"WHERE {' AND '.join(where)} ORDER BY image_name")
+    if limit:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    return conn.execute(sql, params).fetchall()
+
+
+def write_buffers(conn, pins, journal, hashes, downloaded, meta, meta_delete, stats):
+    """
+    在一个事务中提交 AsyncImageDB 缓冲区中的所有记录，中途出错时全部回滚：
+    Pin 和断点续采日志同时提交，不会出现已登记但没有待下载日志的 Pin
+    :param pins: 见 insert_pins
+    :param journal: 见 insert_journal
+    :param hashes: 见 update_hashes
+    :param downloaded: 见 mark_downloaded
+    :param meta: 见 insert_image_meta
+    :param meta_delete: 见 delete_image_meta
+    :param stats: 见 add_task_stats
+    """
+    with conn:
+        write_pins(conn, pins)
+        conn.executemany(INSERT_JOURNAL_SQL, journal)
+        conn.executemany(UPDATE_HASHES_SQL, hashes)
+        conn.executemany(MARK_DOWNLOADED_SQL, downloaded)
+        conn.executemany(INSERT_IMAGE_META_SQL, meta)
+        conn.executemany(DELETE_IMAGE_META_SQL, meta_delete)
+        conn.executemany(ADD_TASK_STATS_SQL, stats)
 
 
 def close_db(conn):
     conn.close()
+
+
+class AsyncImageDB:
+    """
+    异步数据库访问：所有 SQLite 操作在独立的单线程中执行，不阻塞事件循环；
+    写入先进入缓冲区，累积到 DB_BATCH_SIZE 个 Pin 或调用 flush() 时在一个事务中批量提交
+    """
+
+    def __init__(self, db_path=DB_PATH, batch_size=None):
+        """
+        :param db_path: 数据库文件路径
+        :param batch_size: 写缓冲的批量大小，默认读取环境变量 DB_BATCH_SIZE
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size or int(os.getenv('DB_BATCH_SIZE', 200))
+        self.conn = None
+        self._executor = None
+        self._buffer = []
+        self._hash_buffer = []
+        self._journal_buffer = []
+        self._downloaded_buffer = []
+        self._meta_buffer = []
+        self._meta_delete_buffer = []
+        self._task_stats = {}
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def open(self):
+        """
+        在数据库线程中创建连接（首次打开旧版数据库时自动迁移）
+        """
+        if self.conn is not None:
+            return self
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+        self.conn = await self._run(init_db, self.db_path, False)
+        return self
+
+    async def add_task(self, task_dir, url=None, status='running'):
+        """
+        登记采集任务
+        :param task_dir: 任务文件夹
+        :param url: 采集页面地址
+        :param status: 任务状态
+        """
+        await self._run(insert_task, self.conn, task_dir, url, status)
+
+    def record_download(self, task_dir, size, count=1):
+        """
+        累计任务已下载的图片数和字节数（随下一次批量提交写入任务目录）
+        :param size: 图片字节数，删除图片时传入负数
+        :param count: 图片数增量
+        """
+        stats = self._task_stats.setdefault(task_id_from_dir(task_dir), [0, 0])
+        stats[0] += count
+        stats[1] += size
+
+    async def finish_task(self, task_dir, status, image_count=None, total_bytes=None):
+        """
+        提交缓冲区并记录任务结束状态
+        """
+        await self.flush()
+        await self._run(finish_task, self.conn, task_id_from_dir(task_dir), status, image_count, total_bytes)
+
+    async def exists_many(self, pin_keys):
+        """
+        批量查询 Pin 是否已经采集过（包括尚未提交的缓冲区）
+        :param pin_keys: Pin 主键列表
+        :return: {pin_key: task_dir}
+        """
+        found = await self._run(pins_exist, self.conn, pin_keys)
+        wanted = set(pin_keys)
+        for (pin_key, _, _), _, task_dir in self._buffer:
+            if pin_key in wanted:
+                found.setdefault(pin_key, task_dir)
+        return found
+
+    async def add(self, pin_key, pin_id, task_dir, variants):
+        """
+        把 Pin 加入写缓冲区，达到批量大小时自动提交
+        :param pin_key: Pin 主键
+        :param pin_id: Pinterest 的 pin id（可为空）
+        :param task_dir: 任务文件夹
+        :param variants: [(url, scale, width, height), ...]
+        """
+        self._buffer.append(((pin_key, pin_id, task_id_from_dir(task_dir)), variants, task_dir))
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def set_hash(self, pin_key, value, dup_of=None):
+        """
+        记录图片的感知哈希（写入缓冲区）
+        :param pin_key: Pin 主键
+        :param value: 有符号 64 位的 dHash
+        :param dup_of: 近似重复时对应的已采集图片 pin_key
+        """
+        self._hash_buffer.append((value, dup_of, pin_key))
+        if len(self._hash_buffer) >= self.batch_size:
+            await self.flush()
+
+    async def journal(self, task_dir, pin_key, url, image_name, downloaded=False):
+        """
+        记录采集任务已处理的 Pin（写入缓冲区），downloaded 为 False 表示已放入下载队列、尚未下载
+        """
+        self._journal_buffer.append((task_id_from_dir(task_dir), pin_key, url, image_name, int(downloaded)))
+        if len(self._journal_buffer) >= self.batch_size:
+            await self.flush()
+
+    async def mark_downloaded(self, task_dir, pin_key):
+        """
+        标记图片已下载（写入缓冲区）
+        """
+        self._downloaded_buffer.append((task_id_from_dir(task_dir), pin_key))
+        if len(self._downloaded_buffer) >= self.batch_size:
+            await self.flush()
+
+    async def record_image(self, task_dir, pin_key, image_name, meta):
+        """
+        记录下载图片的元数据（写入缓冲区）
+        :param meta: {"width", "height", "format", "bytes", "aspect"}
+        """
+        self._meta_buffer.append((task_id_from_dir(task_dir), image_name, pin_key, meta.get('width'),
+                                  meta.get('height'), meta.get('format'), meta.get('bytes'), meta.get('aspect')))
+        if len(self._meta_buffer) >= self.batch_size:
+            await self.flush()
+
+    def remove_image(self, task_dir, image_name):
+        """
+        删除图片的元数据（随下一次批量提交执行）
+        """
+        self._meta_delete_buffer.append((task_id_from_dir(task_dir), image_name))
+
+    async def save_checkpoint(self, task_dir, url, scroll_round, done=False):
+        """
+        提交缓冲区后记录页面滚动进度，保证断点之前处理过的 Pin 都已写入数据库
+        """
+        await self.flush()
+        await self._run(save_checkpoint, self.conn, task_id_from_dir(task_dir), url, scroll_round, done)
+
+    async def load_checkpoint(self, task_dir):
+        """
+        :return: 任务的断点，格式见 load_checkpoint
+        """
+        return await self._run(load_checkpoint, self.conn, task_id_from_dir(task_dir))
+
+    async def load_hashes(self):
+        """
+        :return: [(pin_key, dhash), ...]
+        """
+        return await self._run(load_hashes, self.conn)
+
+    async def flush(self):
+        """
+        在一个事务中提交缓冲区中的所有记录
+        """
+        pins = [(pin, variants) for pin, variants, _ in self._buffer]
+        buffers = (pins, self._journal_buffer, self._hash_buffer, self._downloaded_buffer, self._meta_buffer,
+                   self._meta_delete_buffer,
+                   [(count, size, task_id) for task_id, (count, size) in self._task_stats.items()])
+        if not any(buffers):
+            return
+        self._buffer, self._journal_buffer, self._hash_buffer, self._downloaded_buffer = [], [], [], []
+        self._meta_buffer, self._meta_delete_buffer, self._task_stats = [], [], {}
+        await self._run(write_buffers, self.conn, *buffers)
+
+    async def close(self):
+        """
+        提交剩余记录并关闭连接
+        """
+        if self.conn is None:
+            return
+        await self.flush()
+        await self._run(close_db, self.conn)
+        self._executor.shutdown(wait=True)
+        self.conn = None
+        self._executor = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,169 @@
+import asyncio
+import os
+
+from dotenv import load_dotenv
+
+from core.db_utils import pin_key_from_url
+from core.thumbnail import thumbnail_sizes
+
+# 加载.env文件中的环境变量
+load_dotenv()
+
+__all__ = ['DownloadPipeline']
+
+
+class DownloadPipeline:
+    """
+    图片下载流水线：页面滚动/解析作为生产者把图片链接放入有界队列，
+    多个下载协程作为消费者并发下载，滚动和下载互不阻塞
+    """
+
+    def __init__(self, image_util, logging, workers=None, queue_size=None, thumbnailer=None, dedup=None,
+                 progress=None, journal=None, results=None):
+        """
+        初始化下载流水线
+        :param image_util: 共享连接池的图片下载器（ImageUtils）
+        :param logging: 日志记录器对象
+        :param workers: 下载协程数量，默认读取环境变量 DOWNLOAD_WORKERS
+        :param queue_size: 队列容量（队列满时生产者等待，形成背压），默认读取环境变量 DOWNLOAD_QUEUE_SIZE
+        :param thumbnailer: 下载完成后的缩略图处理阶段（ThumbnailStage，可选）
+        :param dedup: 感知哈希近似重复过滤（NearDuplicateFilter，可选，需要 thumbnailer 计算哈希）
+        :param progress: 进度回调 progress(done=成功数, failed=失败数)（可选）
+        :param journal: 记录断点续采日志和任务目录的数据库对象（AsyncImageDB，可选），
+                        下载成功后标记为已下载，记录图片元数据，并累计任务的图片数和字节数
+        :param results: 采集结果流（ResultFeed，可选），图片处理完成后发布，供界面逐步显示
+        """
+        self.image_util = image_util
+        self.logging = logging
+        self.workers = workers or int(os.getenv("DOWNLOAD_WORKERS", 8))
+        self.queue = asyncio.Queue(maxsize=queue_size or int(os.getenv("DOWNLOAD_QUEUE_SIZE", 200)))
+        self.succeeded = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.thumbnailer = thumbnailer
+        self.dedup = dedup
+        self.progress = progress
+        self.journal = journal
+        self.results = results
+        self._tasks = []
+        self._post_tasks = set()
+        # 正在下载的图片 (task_dir, image_name)，同一张图片同时只由一个下载协程处理
+        self._inflight = set()
+
+    async def start(self):
+        """
+        启动下载协程
+        """
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self.logging.info(f'下载流水线已启动，下载协程数: {self.workers}')
+
+    async def put(self, task_dir, url, image_name=None):
+        """
+        把待下载的图片放入队列，队列已满时等待
+        :param task_dir: 图片保存的任务文件夹
+        :param url: 图片 URL
+        :param image_name: 保存的图片名称（可选）
+        """
+        await self.queue.put((task_dir, url, image_name))
+
+    async def _worker(self, index):
+        while True:
+            task_dir, url, image_name = await self.queue.get()
+            key = (task_dir, image_name or url.split('/')[-1])
+            if key in self._inflight:
+                self.logging.debug(f'图片 {key[1]} 正在由其他下载协程下载，跳过')
+                self.queue.task_done()
+                continue
+            self._inflight.add(key)
+            try:
+                image_path = os.path.join(*key)
+                existed = os.path.exists(image_path)
+                meta = {}
+                ok = await self.image_util.download_and_resize_image(task_dir, self.logging, url,
+                                                                     image_name=image_name, meta=meta)
+                if ok:
+                    self.succeeded += 1
+                    if self.journal is not None:
+                        await self.journal.mark_downloaded(task_dir, pin_key_from_url(url))
+                        if meta:
+                            await self.journal.record_image(task_dir, pin_key_from_url(url),
+                                                            os.path.basename(image_path), meta)
+                        if not existed:
+                            self.journal.record_download(task_dir, os.path.getsize(image_path))
+                    if self.thumbnailer is not None:
+                        self._post_process(url, image_path)
+                    elif self.results is not None:
+                        self.results.publish(image_path)
+                else:
+                    self.failed += 1
+            except Exception as e:
+                self.failed += 1
+                self.logging.error(f'下载协程 {index} 处理 {url} 时出错: {e}')
+            finally:
+                self._inflight.discard(key)
+                self.queue.task_done()
+                if self.progress is not None:
+                    self.progress(done=self.succeeded, failed=self.failed)
+
+    async def _after_download(self, url, image_path):
+        preview = None
+        try:
+            result = await self.thumbnailer.process(image_path)
+            preview = result["thumbnails"].get(thumbnail_sizes()[0])
+            if self.dedup is not None and result["dhash"] is not None:
+                paths = [image_path] + list(result["thumbnails"].values())
+                size = os.path.getsize(image_path) if os.path.exists(image_path) else 0
+                if await self.dedup.check(pin_key_from_url(url), result["dhash"], paths):
+                    self.duplicates += 1
+                    if self.journal is not None and not os.path.exists(image_path):
+                        # 重复图片已删除，从任务目录的统计和图片元数据中扣除
+                        self.journal.record_download(os.path.dirname(image_path), -size, count=-1)
+                        self.journal.remove_image(os.path.dirname(image_path), os.path.basename(image_path))
+        except Exception as e:
+            # 后台任务的异常不会被等待方处理，在这里记录；图片仍然发布到结果流
+            self.logging.error(f'处理图片 {os.path.basename(image_path)} 时出错: {e}')
+        if self.results is not None and os.path.exists(image_path):
+            self.results.publish(image_path, preview)
+
+    def _post_process(self, url, image_path):
+        """
+        在后台生成缩略图、检查近似重复，不阻塞下载协程
+        """
+        task = asyncio.create_task(self._after_download(url, image_path))
+        self._post_tasks.add(task)
+        task.add_done_callback(self._post_tasks.discard)
+
+    async def drain(self):
+        """
+        等待队列中所有图片下载完成，然后停止下载协程
+        """
+        if self.queue.qsize():
+            self.logging.info(f'等待剩余 {self.queue.qsize()} 张图片下载完成...')
+        await self.queue.join()
+        if self._post_tasks:
+            await asyncio.gather(*self._post_tasks, return_exceptions=True)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.logging.info(f'下载流水线结束，成功 {self.succeeded} 张，失败 {self.failed} 张，'
+                          f'近似重复 {self.duplicates} 张')
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.drain()
+        else:
+            # 出错或取消时不再等待剩余下载和后台处理，直接停止；
+            # 等后台处理真正结束后再返回，之后才会关闭缩略图进程池和数据库
+            tasks = self._tasks + list(self._post_tasks)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._tasks = []
+            self._post_tasks.clear()
@@ -1,10 +1,16 @@
+import asyncio
 import os
+import struct
+import tempfile
 from io import BytesIO
+from urllib.parse import urlparse
 from PIL import Image
 from dotenv import load_dotenv
 import aiohttp
 from aiohttp_socks import ProxyConnector
 
+from core.rate_limit import HostRateLimiter, backoff_delay, retry_after_seconds
+
 # 加载.env文件中的环境变量
 load_dotenv()
 # # 获取当前脚本的绝对路径
@@ -12,22 +18,216 @@ load_dotenv()
 # # 推导项目根目录（假设项目根目录是当前脚本的祖父目录）
 # project_root = os.path.dirname(os.path.dirname(current_file_path))
 
-__all__ = ["ImageUtils"]
+__all__ = ["ImageUtils", "detect_image_format", "image_size_from_header", "image_meta", "read_image_meta"]
+
+# 流式下载时每次读取的字节数
+CHUNK_SIZE = 64 * 1024
+# 解析图片尺寸时保留的文件头字节数（JPEG 的 EXIF 较大时尺寸信息可能在更靠后的位置）
+HEADER_SIZE = 64 * 1024
+# JPEG 中记录图片尺寸的 SOF 标记（不包括 DHT、JPG、DAC）
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# 需要降低并发并重试的状态码（限流、服务器错误）
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3',
+    'Referer': 'https://www.pinterest.com/'
+}
+
+
+def detect_image_format(header):
+    """
+    根据文件头判断图片格式
+    :param header: 文件开头的若干字节（至少 12 字节）
+    :return: jpeg / png / gif / webp，无法识别时返回 None
+    """
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def _jpeg_size(header):
+    i = 2
+    while i + 9 <= len(header):
+        if header[i] != 0xFF:
+            return None
+        marker = header[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        length = struct.unpack('>H', header[i + 2:i + 4])[0]
+        if marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>HH', header[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+
+def _webp_size(header):
+    chunk = header[12:16]
+    if chunk == b'VP8X' and len(header) >= 30:
+        return (int.from_bytes(header[24:27], 'little') + 1, int.from_bytes(header[27:30], 'little') + 1)
+    if chunk == b'VP8 ' and len(header) >= 30:
+        width, height = struct.unpack('<HH', header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(header) >= 25:
+        bits = int.from_bytes(header[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    return None
+
+
+def image_size_from_header(header):
+    """
+    只根据文件头解析图片尺寸，不解码图片数据
+    :param header: 文件开头的字节（JPEG 需要包含 SOF 段）
+    :return: (格式, 宽, 高)，无法解析时尺寸为 None
+    """
+    image_format = detect_image_format(header)
+    size = None
+    if image_format == 'jpeg':
+        size = _jpeg_size(header)
+    elif image_format == 'png' and len(header) >= 24:
+        size = struct.unpack('>II', header[16:24])
+    elif image_format == 'gif' and len(header) >= 10:
+        size = struct.unpack('<HH', header[6:10])
+    elif image_format == 'webp':
+        size = _webp_size(header)
+    width, height = size or (None, None)
+    return image_format, width, height
+
+
+def image_meta(header, size, image_path=None):
+    """
+    图片元数据：宽、高、格式、字节数、宽高比
+    :param header: 文件开头的字节
+    :param size: 文件字节数
+    :param image_path: 文件头中找不到尺寸时用 PIL 打开文件读取（只读取文件头，不解码）
+    :return: {"width", "height", "format", "bytes", "aspect"}
+    """
+    image_format, width, height = image_size_from_header(header)
+    if width is None and image_path is not None:
+        try:
+            with Image.open(image_path) as image:
+                width, height = image.size
+                image_format = image_format or (image.format or '').lower() or None
+        except Exception:
+            pass
+    aspect = round(width / height, 4) if width and height else None
+    return {"width": width, "height": height, "format": image_format, "bytes": size, "aspect": aspect}
+
+
+def read_image_meta(image_path):
+    """
+    读取已保存图片的元数据（只读取文件头）
+    """
+    with open(image_path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    return image_meta(header, os.path.getsize(image_path), image_path)
 
 
 class ImageUtils:
-    def __init__(self, proxy_url=None):
+    def __init__(self, proxy_url=None, limiter=None):
         """
         初始化 ImageUtils 类
         :param proxy_url: 代理服务器 URL（可选）
+        :param limiter: 按主机划分的下载限制器（HostRateLimiter，可选，多个任务可共用）
         """
         self.proxy_url = proxy_url
+        self.session = None
+        self.limiter = limiter or HostRateLimiter()
+        self.retries = int(os.getenv("DOWNLOAD_RETRIES", 3))
+        self.timeout = aiohttp.ClientTimeout(total=float(os.getenv("DOWNLOAD_TIMEOUT", 10)))
+
+    async def open(self):
+        """
+        创建采集任务内共享的 HTTP 会话和连接池（长连接、DNS 缓存、单主机连接数限制）
+        :return: aiohttp.ClientSession 对象
+        """
+        if self.session is not None and not self.session.closed:
+            return self.session
+
+        connector_kwargs = {
+            "limit": int(os.getenv("DOWNLOAD_POOL_SIZE", 100)),  # 连接池总连接数
+            "limit_per_host": int(os.getenv("DOWNLOAD_LIMIT_PER_HOST", 16)),  # 单个主机(i.pinimg.com)的连接数
+            "ttl_dns_cache": int(os.getenv("DOWNLOAD_DNS_CACHE_TTL", 300)),  # DNS 缓存时间（秒）
+            "keepalive_timeout": int(os.getenv("DOWNLOAD_KEEPALIVE_TIMEOUT", 60)),  # 空闲长连接保持时间（秒）
+        }
+        if self.proxy_url:
+            connector = ProxyConnector.from_url(self.proxy_url, **connector_kwargs)
+        else:
+            connector = aiohttp.TCPConnector(**connector_kwargs)
+
+        self.session = aiohttp.ClientSession(connector=connector, headers=DEFAULT_HEADERS)
+        return self.session
+
+    async def close(self):
+        """
+        关闭共享的 HTTP 会话和连接池
+        """
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
 
-    async def download_and_resize_image(self, task_dir, logging, url, image_name=None):
+    @staticmethod
+    async def _stream_to_file(response, save_path):
+        """
+        把响应内容按块写入临时文件，校验文件头和长度后原子重命名为正式文件，
+        保留原始字节不重新编码；下载中断时删除临时文件，不会留下不完整的图片
+        :param response: aiohttp 响应对象
+        :param save_path: 图片保存路径
+        :return: 图片元数据（由下载时保留的文件头解析，见 image_meta）
+        """
+        # 每次下载使用独立的临时文件，同一张图片被并行下载时不会互相覆盖
+        fd, part_path = tempfile.mkstemp(dir=os.path.dirname(save_path) or '.',
+                                         prefix=f'{os.path.basename(save_path)}.', suffix='.part')
+        header = b''
+        written = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    if len(header) < HEADER_SIZE:
+                        checked = len(header) >= 12
+                        header += chunk[:HEADER_SIZE - len(header)]
+                        if not checked and len(header) >= 12 and detect_image_format(header) is None:
+                            raise ValueError(f'响应内容不是图片（Content-Type: {response.content_type}）')
+                    f.write(chunk)
+                    written += len(chunk)
+            if detect_image_format(header) is None:
+                raise ValueError(f'响应内容不是图片（Content-Type: {response.content_type}）')
+            # 响应经过压缩传输时 Content-Length 是压缩后的长度，无法比较
+            expected = response.content_length
+            if expected is not None and not response.headers.get('Content-Encoding') and written != expected:
+                raise ValueError(f'图片不完整，已下载 {written} / {expected} 字节')
+            os.replace(part_path, save_path)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        return image_meta(header, written, save_path)
+
+    async def download_and_resize_image(self, task_dir, logging, url, image_name=None, meta=None):
         """
         下载并调整图片尺寸
         :param url: 图片 URL
         :param image_name: 保存的图片名称（可选）
+        :param meta: 字典（可选），下载成功时写入图片元数据（width / height / format / bytes / aspect）
         :return: 下载是否成功
         """
         if image_name is None:
@@ -36,39 +236,61 @@ class ImageUtils:
         save_path = os.path.join(image_dir, f"{image_name}")
         if os.path.exists(save_path):
             logging.info(f"图片 {image_name} 已经下载并存在")
+            if meta is not None:
+                meta.update(read_image_meta(save_path))
             return True
 
-        if self.proxy_url:
-            connector = ProxyConnector.from_url(self.proxy_url)
-        else:
-            connector = None
+        # 未调用 open() 时临时创建会话，下载完成后关闭
+        own_session = self.session is None or self.session.closed
+        host = self.limiter.for_host(urlparse(url).hostname or '')
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3',
-                'Referer': 'https://www.pinterest.com/'
-            }
-            async with aiohttp.ClientSession(connector=connector) as session:
-                async with session.get(url, headers=headers, timeout=10) as response:
-                    if response.status == 200:
-                        image_data = BytesIO(await response.read())
-                        image = Image.open(image_data)
-
-                        # if image_name is None:
-                        #     image_name = url.split('/')[-1]
-                        # image_dir = task_dir
-                        # # print(image_dir)
-                        # # if image_dir and not os.path.exists(image_dir):
-                        # #     os.makedirs(image_dir)
-                        # save_path = os.path.join(image_dir, f"{image_name}")
-                        image.save(save_path)
-                        logging.info(f"图片下载成功")
-                        return True
-                    else:
-                        logging.error(f'下载图片失败，状态码: {response.status}')
-                        return False
+            session = await self.open() if own_session else self.session
+            for attempt in range(self.retries + 1):
+                retry_after = None
+                try:
+                    async with host.slot() as started:
+                        async with session.get(url, timeout=self.timeout) as response:
+                            if response.status == 200:
+                                info = await self._save(response, save_path)
+                                if meta is not None:
+                                    meta.update(info)
+                                host.on_success(started)
+                                logging.info(f"图片下载成功")
+                                return True
+                            if response.status not in RETRY_STATUSES:
+                                logging.error(f'下载图片失败，状态码: {response.status}')
+                                return False
+                            retry_after = retry_after_seconds(response.headers)
+                            reason = f'状态码: {response.status}'
+                except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                    reason = f'{type(e).__name__} {e}'
+                # 限流、服务器错误或超时：降低该主机的并发上限，退避后重试
+                host.on_congestion(logging)
+                if attempt == self.retries:
+                    logging.error(f'下载图片失败（已重试 {self.retries} 次），{reason}')
+                    return False
+                # 服务器给出的 Retry-After 不超过 DOWNLOAD_BACKOFF_MAX，避免异常的大数值长时间占用下载协程
+                max_delay = float(os.getenv("DOWNLOAD_BACKOFF_MAX", 30))
+                delay = min(retry_after, max_delay) if retry_after is not None else backoff_delay(attempt)
+                logging.warning(f'下载图片失败，{reason}，{delay:.1f} 秒后第 {attempt + 1} 次重试')
+                await asyncio.sleep(delay)
         except Exception as e:
             logging.error(f'下载图片时出错: {e}')
             return False
+        finally:
+            if own_session:
+                await self.close()
+
+    async def _save(self, response, save_path):
+        """
+        :return: 图片元数据（见 image_meta）
+        """
+        if os.getenv("DOWNLOAD_MODE", "stream").lower() == "reencode":
+            image_data = BytesIO(await response.read())
+            image = Image.open(image_data)
+            image.save(save_path)
+            return read_image_meta(save_path)
+        return await self._stream_to_file(response, save_path)
 
 #
 # if __name__ == "__main__":
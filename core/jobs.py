@@ -0,0 +1,276 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from core.db_utils import DB_PATH, init_db
+
+# 加载.env文件中的环境变量
+load_dotenv()
+
+__all__ = ['JobStore', 'JobProgress', 'JobScheduler']
+
+# 任务状态
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+JOB_COLUMNS = ('job_id', 'status', 'params', 'task_dir', 'done', 'failed', 'message', 'created_at', 'started_at',
+               'finished_at')
+
+
+class JobStore:
+    """
+    持久化的采集任务队列（SQLite jobs 表），Gradio 线程和调度器线程共用一个连接，用锁串行访问
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.conn = init_db(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def _execute(self, sql, params=()):
+        with self._lock, self.conn:
+            return self.conn.execute(sql, params)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(zip(JOB_COLUMNS, row))
+        job['params'] = json.loads(job['params'])
+        return job
+
+    def add(self, params):
+        """
+        加入一个排队中的任务
+        :param params: 任务参数（可 JSON 序列化的字典）
+        :return: 任务 ID
+        """
+        return self._execute("INSERT INTO jobs (status, params) VALUES (?, ?)",
+                             (QUEUED, json.dumps(params, ensure_ascii=False))).lastrowid
+
+    def claim_next(self):
+        """
+        领取最早排队的任务并标记为运行中
+        :return: (任务 ID, 任务参数, 任务文件夹)，没有排队任务时返回 None；任务文件夹不为空表示断点续采
+        """
+        with self._lock, self.conn:
+            row = self.conn.execute("SELECT job_id, params, task_dir FROM jobs WHERE status=? "
+                                    "ORDER BY job_id LIMIT 1", (QUEUED,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE jobs SET status=?, started_at=CURRENT_TIMESTAMP WHERE job_id=?",
+                              (RUNNING, row[0]))
+        return row[0], json.loads(row[1]), row[2]
+
+    def update(self, job_id, **fields):
+        """
+        更新任务进度
+        :param fields: task_dir / done / failed / message
+        """
+        if not fields:
+            return
+        columns = ', '.join(f'{name}=?' for name in fields)
+        self._execute(f"UPDATE jobs SET {columns} WHERE job_id=?", (*fields.values(), job_id))
+
+    def finish(self, job_id, status, message=None):
+        self._execute("UPDATE jobs SET status=?, message=COALESCE(?, message), finished_at=CURRENT_TIMESTAMP "
+                      "WHERE job_id=?", (status, message, job_id))
+
+    def cancel_queued(self, job_id):
+        """
+        取消尚未开始的任务
+        :return: 是否取消成功
+        """
+        return self._execute("UPDATE jobs SET status=?, message=?, finished_at=CURRENT_TIMESTAMP "
+                             "WHERE job_id=? AND status=?", (CANCELLED, '任务已取消', job_id, QUEUED)).rowcount > 0
+
+    def requeue(self, job_id):
+        """
+        把失败或已取消的任务重新放回队列，重新执行时从断点继续
+        :return: 是否重新排队成功
+        """
+        return self._execute("UPDATE jobs SET status=?, message=?, finished_at=NULL "
+                             "WHERE job_id=? AND status IN (?, ?)",
+                             (QUEUED, '等待从断点继续', job_id, FAILED, CANCELLED)).rowcount > 0
+
+    def requeue_interrupted(self):
+        """
+        应用重启后，把上次未完成（运行中）的任务重新放回队列，重新执行时从断点继续
+        :return: 重新排队的任务数
+        """
+        return self._execute("UPDATE jobs SET status=? WHERE status=?", (QUEUED, RUNNING)).rowcount
+
+    def get(self, job_id):
+        rows = self._query(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE job_id=?", (job_id,))
+        return self._to_dict(rows[0]) if rows else None
+
+    def recent(self, limit=20):
+        """
+        最近提交的任务，按提交时间倒序
+        """
+        rows = self._query(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs ORDER BY job_id DESC LIMIT ?", (limit,))
+        return [self._to_dict(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class JobProgress:
+    """
+    任务进度回调：采集过程中调用 progress(done=..., failed=..., message=...) 上报进度，
+    下载计数按 JOB_PROGRESS_INTERVAL 秒节流写入数据库，task_dir 和 message 立即写入
+    """
+
+    def __init__(self, store, job_id, task_dir=None, interval=None):
+        """
+        :param task_dir: 任务上次使用的文件夹，断点续采时沿用
+        """
+        self.store = store
+        self.job_id = job_id
+        self.task_dir = task_dir
+        self.interval = interval if interval is not None else float(os.getenv('JOB_PROGRESS_INTERVAL', 1))
+        self._pending = {}
+        self._last = 0.0
+
+    def __call__(self, **fields):
+        self._pending.update(fields)
+        self.task_dir = fields.get('task_dir', self.task_dir)
+        now = time.monotonic()
+        if 'task_dir' in fields or 'message' in fields or now - self._last >= self.interval:
+            self.flush()
+            self._last = now
+
+    def flush(self):
+        if self._pending:
+            fields, self._pending = self._pending, {}
+            self.store.update(self.job_id, **fields)
+
+
+class JobScheduler:
+    """
+    采集任务调度器：在浏览器服务的事件循环中运行，从持久化队列中领取任务，
+    最多同时运行 JOB_WORKERS 个任务；支持查询状态和取消任务
+    """
+
+    def __init__(self, runner, service, logging, store=None, workers=None, poll_interval=None):
+        """
+        :param runner: 执行任务的协程函数 runner(params, progress)，返回结果说明
+        :param service: 提供事件循环的浏览器服务（BrowserService）
+        :param logging: 日志记录器对象
+        :param store: 任务队列（JobStore），默认使用采集数据库
+        :param workers: 同时运行的任务数，默认读取环境变量 JOB_WORKERS
+        :param poll_interval: 队列轮询间隔（秒），默认读取环境变量 JOB_POLL_INTERVAL
+        """
+        self.runner = runner
+        self.service = service
+        self.logging = logging
+        self.store = store or JobStore()
+        self.workers = workers or int(os.getenv('JOB_WORKERS', 2))
+        self.poll_interval = poll_interval or float(os.getenv('JOB_POLL_INTERVAL', 2))
+        self._running = {}
+        self._wakeup = None
+        self._dispatcher = None
+
+    def start(self):
+        """
+        启动调度（上次未完成的任务重新排队）
+        """
+        if self._dispatcher is not None:
+            return self
+        requeued = self.store.requeue_interrupted()
+        if requeued:
+            self.logging.info(f'{requeued} 个未完成的采集任务已重新排队')
+        self._dispatcher = self.service.submit(self._dispatch())
+        return self
+
+    def submit(self, params):
+        """
+        提交采集任务
+        :param params: 任务参数
+        :return: 任务 ID
+        """
+        job_id = self.store.add(params)
+        self._wake_threadsafe()
+        return job_id
+
+    def cancel(self, job_id):
+        """
+        取消任务：排队中的任务直接取消，运行中的任务在事件循环中取消
+        :return: 是否已取消或已发出取消请求
+        """
+        if self.store.cancel_queued(job_id):
+            return True
+        job = self.store.get(job_id)
+        if job is None or job['status'] != RUNNING:
+            return False
+        self.service.loop.call_soon_threadsafe(self._cancel_running, job_id)
+        return True
+
+    def resume(self, job_id):
+        """
+        从断点继续执行失败或已取消的任务
+        :return: 是否重新排队成功
+        """
+        if not self.store.requeue(job_id):
+            return False
+        self._wake_threadsafe()
+        return True
+
+    def status(self, job_id):
+        return self.store.get(job_id)
+
+    def recent(self, limit=20):
+        return self.store.recent(limit)
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _wake_threadsafe(self):
+        if self.service.loop is not None:
+            self.service.loop.call_soon_threadsafe(self._wake)
+
+    def _cancel_running(self, job_id):
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+
+    async def _dispatch(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            while len(self._running) < self.workers:
+                job = self.store.claim_next()
+                if job is None:
+                    break
+                job_id, params, task_dir = job
+                self._running[job_id] = asyncio.create_task(self._run_job(job_id, params, task_dir))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_job(self, job_id, params, task_dir=None):
+        progress = JobProgress(self.store, job_id, task_dir)
+        self.logging.info(f'{"从断点继续" if task_dir else "开始"}执行采集任务 #{job_id}')
+        try:
+            message = await self.runner(params, progress)
+            progress.flush()
+            self.store.finish(job_id, DONE, message)
+        except asyncio.CancelledError:
+            progress.flush()
+            self.store.finish(job_id, CANCELLED, '任务已取消')
+            self.logging.info(f'采集任务 #{job_id} 已取消')
+        except Exception as e:
+            progress.flush()
+            self.store.finish(job_id, FAILED, f'任务失败：{e}')
+            self.logging.error(f'采集任务 #{job_id} 失败: {e}')
+        finally:
+            self._running.pop(job_id, None)
+            self._wake()
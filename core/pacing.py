@@ -0,0 +1,165 @@
+import asyncio
+import os
+import random
+import time
+
+from dotenv import load_dotenv
+
+from core.pin_api import PIN_RESOURCE_PATTERNS
+
+# 加载.env文件中的环境变量
+load_dotenv()
+
+__all__ = ['ScrollPacer']
+
+PIN_SELECTOR = '[data-grid-item="true"], [data-test-id="pinrep-video"], [data-test-id="non-story-pin-image"]'
+
+# 滚动前的页面状态：[Pin 元素数量, MutationObserver 记录的插入序号（未安装时为 null）]
+SNAPSHOT_JS = """(selector) => [
+    document.querySelectorAll(selector).length,
+    window.__pinTracker ? window.__pinTracker.inserted : null,
+]"""
+
+# 是否出现了新的 Pin 元素：已安装 MutationObserver 时只检查滚动之后插入的节点（插入序号大于 mark），
+# 滚动前插入、尚未收集的节点不算新内容；否则比较元素数量
+NEW_CONTENT_JS = """([selector, baseline, mark]) => {
+    const tracker = window.__pinTracker;
+    if (tracker && mark !== null) {
+        for (const node of tracker.pending) {
+            if ((tracker.stamps.get(node) || 0) <= mark) continue;
+            if (node.isConnected && node.matches && (node.matches(selector) || node.querySelector(selector))) return true;
+        }
+        return false;
+    }
+    return document.querySelectorAll(selector).length > baseline;
+}"""
+
+
+class ScrollPacer:
+    """
+    页面滚动节奏控制
+    - fixed：每次滚动后固定等待 SCROLL_WAIT_TIME 秒
+    - adaptive：出现新的 Pin、资源接口返回或网络空闲任一条件满足即结束等待，
+      最长等待 SCROLL_WAIT_MAX 秒，并保留 SCROLL_WAIT_MIN + 随机 SCROLL_WAIT_JITTER 秒的最短间隔，避免请求过快被封
+    """
+
+    def __init__(self, page, logging, mode=None):
+        """
+        :param page: Playwright 页面对象
+        :param logging: 日志记录器对象
+        :param mode: 等待方式 fixed / adaptive，默认读取环境变量 SCROLL_WAIT_MODE
+        """
+        self.page = page
+        self.logging = logging
+        self.mode = (mode or os.getenv('SCROLL_WAIT_MODE', 'fixed')).lower()
+        self.wait_time = float(os.getenv('SCROLL_WAIT_TIME', 5))
+        self.max_wait = float(os.getenv('SCROLL_WAIT_MAX', self.wait_time))
+        self.min_wait = float(os.getenv('SCROLL_WAIT_MIN', 1))
+        self.jitter = float(os.getenv('SCROLL_WAIT_JITTER', 1))
+        self.idle_time = float(os.getenv('NETWORK_IDLE_TIME', 0.5))
+        self._inflight = 0
+        self._last_activity = time.monotonic()
+        self._resource_done = asyncio.Event()
+
+    @property
+    def adaptive(self):
+        return self.mode == 'adaptive'
+
+    def attach(self):
+        """
+        监听页面请求，用于判断资源接口是否返回以及网络是否空闲
+        """
+        if not self.adaptive:
+            return
+        self.page.on('request', self._on_request)
+        self.page.on('requestfinished', self._on_request_done)
+        self.page.on('requestfailed', self._on_request_done)
+
+    def detach(self):
+        if not self.adaptive:
+            return
+        self.page.remove_listener('request', self._on_request)
+        self.page.remove_listener('requestfinished', self._on_request_done)
+        self.page.remove_listener('requestfailed', self._on_request_done)
+
+    def _on_request(self, request):
+        self._inflight += 1
+        self._last_activity = time.monotonic()
+
+    def _on_request_done(self, request):
+        self._inflight = max(0, self._inflight - 1)
+        self._last_activity = time.monotonic()
+        if any(pattern in request.url for pattern in PIN_RESOURCE_PATTERNS):
+            self._resource_done.set()
+
+    async def _wait_network_idle(self, started):
+        """
+        等待网络空闲：没有进行中的请求，且从滚动开始（或之后最后一次请求开始/结束）起已安静 idle_time 秒；
+        滚动之前的网络活动不计入，避免滚动前网络已空闲时立即结束等待
+        :param started: 滚动开始时间
+        """
+        while self._inflight > 0 or time.monotonic() - max(started, self._last_activity) < self.idle_time:
+            await asyncio.sleep(0.1)
+
+    async def _wait_new_content(self, baseline, mark):
+        await self.page.wait_for_function(NEW_CONTENT_JS, arg=[PIN_SELECTOR, baseline, mark], polling=100,
+                                          timeout=self.max_wait * 1000)
+
+    async def _wait(self, baseline, started, mark=None):
+        """
+        :param baseline: 滚动前的 Pin 元素数量
+        :param started: 滚动开始时间
+        :param mark: 滚动前的插入序号，之后插入的节点才算新内容
+        """
+        waiters = {
+            asyncio.create_task(self._wait_new_content(baseline, mark)): '出现新的 Pin',
+            asyncio.create_task(self._resource_done.wait()): '资源接口已返回',
+            asyncio.create_task(self._wait_network_idle(started)): '网络空闲',
+        }
+        done, pending = await asyncio.wait(waiters, timeout=self.max_wait, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        reason = '达到最长等待时间'
+        for task in done:
+            if task.exception() is None:
+                reason = waiters[task]
+                break
+
+        # 保留最短等待间隔（带随机抖动），模拟人工浏览节奏
+        floor = self.min_wait + random.uniform(0, self.jitter)
+        elapsed = time.monotonic() - started
+        if elapsed < floor:
+            await asyncio.sleep(floor - elapsed)
+        self.logging.debug(f'滚动等待结束（{reason}），耗时 {time.monotonic() - started:.2f}s')
+
+    async def _snapshot(self):
+        return await self.page.evaluate(SNAPSHOT_JS, PIN_SELECTOR)
+
+    async def wait_loaded(self, fixed_wait=5):
+        """
+        页面打开后等待首屏 Pin 加载
+        :param fixed_wait: fixed 模式下的等待秒数
+        """
+        if not self.adaptive:
+            await asyncio.sleep(fixed_wait)
+            return
+        started = time.monotonic()
+        self._resource_done.clear()
+        await self._wait(0, started)
+
+    async def scroll(self, distance):
+        """
+        滚动页面并等待新内容加载
+        :param distance: 滚动距离（像素）
+        """
+        if not self.adaptive:
+            await self.page.mouse.wheel(0, distance)
+            await asyncio.sleep(self.wait_time)
+            return
+        baseline, mark = await self._snapshot()
+        self._resource_done.clear()
+        started = time.monotonic()
+        await self.page.mouse.wheel(0, distance)
+        await self._wait(baseline, started, mark)
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import zipfile
+
+__all__ = ['folder_manifest', 'package_folder', 'stream_zip']
+
+# 已经压缩过的格式直接存储（ZIP_STORED），再用 DEFLATE 压缩几乎不会变小，只会消耗 CPU
+STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.zip', '.mp4')
+# 复制文件时每次读取的字节数
+COPY_CHUNK_SIZE = 1024 * 1024
+# 未下载完成的临时文件不打包
+SKIP_SUFFIXES = ('.part',)
+
+
+def compress_type_for(name):
+    return zipfile.ZIP_STORED if name.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+
+
+def iter_folder(folder_path):
+    """
+    按固定顺序遍历文件夹中需要打包的文件，缩略图文件夹（THUMBNAIL_DIR）可以重新生成，不打包
+    :return: [(文件路径, 压缩包内的相对路径), ...]
+    """
+    files = []
+    thumbnail_dir = os.getenv('THUMBNAIL_DIR', 'thumbnails')
+    for root, dirs, names in os.walk(folder_path):
+        if root == folder_path and thumbnail_dir in dirs:
+            dirs.remove(thumbnail_dir)
+        dirs.sort()
+        for name in sorted(names):
+            if name.endswith(SKIP_SUFFIXES):
+                continue
+            file_path = os.path.join(root, name)
+            files.append((file_path, os.path.relpath(file_path, folder_path)))
+    return files
+
+
+def folder_manifest(folder_path):
+    """
+    文件夹清单摘要：由每个文件的相对路径、大小和修改时间计算，文件夹内容不变时摘要不变
+    :param folder_path: 文件夹路径
+    :return: 摘要字符串
+    """
+    digest = hashlib.sha1()
+    for file_path, arcname in iter_folder(folder_path):
+        stat = os.stat(file_path)
+        digest.update(f'{arcname}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _manifest_path(zip_path):
+    return f'{zip_path}.manifest.json'
+
+
+def package_folder(folder_path, zip_path, logging=None):
+    """
+    把文件夹打包为 .zip 文件：图片使用 ZIP_STORED 直接存储，其他文件使用 ZIP_DEFLATED；
+    文件夹清单与上次打包时相同则直接复用已有的压缩包
+    :param folder_path: 文件夹路径
+    :param zip_path: .zip 文件路径
+    :param logging: 日志记录器对象（可选）
+    :return: .zip 文件路径
+    """
+    manifest = folder_manifest(folder_path)
+    manifest_path = _manifest_path(zip_path)
+    if os.path.exists(zip_path) and os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            try:
+                cached = json.load(f).get('manifest')
+            except json.JSONDecodeError:
+                cached = None
+        if cached == manifest:
+            if logging is not None:
+                logging.info(f'文件夹未变化，复用已打包的 {os.path.basename(zip_path)}')
+            return zip_path
+
+    # 先写入临时文件，完成后再替换，打包中途失败不会留下损坏的压缩包
+    part_path = f'{zip_path}.part'
+    try:
+        with zipfile.ZipFile(part_path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zipf:
+            for file_path, arcname in iter_folder(folder_path):
+                zipf.write(file_path, arcname, compress_type=compress_type_for(arcname))
+        os.replace(part_path, zip_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({'manifest': manifest}, f)
+    return zip_path
+
+
+class _ChunkSink:
+    """
+    不可 seek 的写入目标，zipfile 写入的数据暂存在内存中，由 stream_zip 逐块取出
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(folder_path, chunk_size=COPY_CHUNK_SIZE):
+    """
+    边打包边输出 .zip 数据，不在磁盘上生成完整的临时压缩包
+    （目标不可 seek 时 zipfile 使用数据描述符记录文件大小和 CRC）
+    :param folder_path: 文件夹路径
+    :param chunk_size: 每次读取的字节数
+    :return: 逐块产生 .zip 字节数据的生成器
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zipf:
+        for file_path, arcname in iter_folder(folder_path):
+            info = zipfile.ZipInfo.from_file(file_path, arcname)
+            info.compress_type = compress_type_for(arcname)
+            with open(file_path, 'rb') as src, zipf.open(info, 'w', force_zip64=True) as dst:
+                while True:
+                    data = src.read(chunk_size)
+                    if not data:
+                        break
+                    dst.write(data)
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
@@ -0,0 +1,175 @@
+import os
+import threading
+
+from PIL import Image
+from dotenv import load_dotenv
+
+# 加载.env文件中的环境变量
+load_dotenv()
+
+__all__ = ['dhash', 'hamming', 'to_signed', 'to_unsigned', 'HashIndex', 'NearDuplicateFilter']
+
+HASH_BITS = 64
+
+# 进程内共用的哈希索引，按最大汉明距离区分，首次使用时从数据库加载，之后随采集增量更新
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+def dhash(image, hash_size=8):
+    """
+    计算图片的差异哈希（dHash）：缩小为 (hash_size + 1) x hash_size 的灰度图，比较相邻像素的明暗
+    :param image: PIL 图片对象
+    :param hash_size: 哈希边长，默认 8（64 位）
+    :return: 整数形式的哈希值
+    """
+    gray = image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(gray.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a, b):
+    """
+    两个哈希值的汉明距离
+    """
+    return (a ^ b).bit_count()
+
+
+def to_signed(value):
+    """
+    SQLite 的 INTEGER 是有符号 64 位整数，存储前转换
+    """
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def to_unsigned(value):
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+class HashIndex:
+    """
+    汉明距离近邻索引（多索引哈希）：把 64 位哈希切分成 max_distance + 1 段，
+    根据抽屉原理，距离不超过 max_distance 的两个哈希至少有一段完全相同，
+    查询时只需比较各段命中的候选项，而不必遍历全部哈希
+    """
+
+    def __init__(self, max_distance=4):
+        """
+        :param max_distance: 判定为近似重复的最大汉明距离
+        """
+        self.max_distance = max_distance
+        segments = max_distance + 1
+        width, extra = divmod(HASH_BITS, segments)
+        self._bands = []
+        shift = 0
+        for i in range(segments):
+            bits = width + (1 if i < extra else 0)
+            self._bands.append((shift, (1 << bits) - 1))
+            shift += bits
+        self._tables = [{} for _ in self._bands]
+        self.size = 0
+
+    def _band_keys(self, value):
+        return [(value >> shift) & mask for shift, mask in self._bands]
+
+    def add(self, value, key):
+        """
+        加入一个哈希
+        :param value: 哈希值
+        :param key: 关联的主键（pin_key）
+        """
+        for table, band in zip(self._tables, self._band_keys(value)):
+            table.setdefault(band, []).append((value, key))
+        self.size += 1
+
+    def query(self, value):
+        """
+        查找距离最近的近似重复项
+        :param value: 哈希值
+        :return: (key, 距离)，没有距离在 max_distance 以内的哈希时返回 None
+        """
+        best = None
+        for table, band in zip(self._tables, self._band_keys(value)):
+            for candidate, key in table.get(band, ()):
+                distance = (candidate ^ value).bit_count()
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (key, distance)
+                    if distance == 0:
+                        return best
+        return best
+
+
+class NearDuplicateFilter:
+    """
+    基于感知哈希的近似重复图片过滤：下载完成后与所有任务中已采集图片的哈希比较，
+    PHASH_ACTION=flag 时仅在数据库中标记（默认），skip 时删除重复图片；
+    哈希索引在进程内共用，每个任务不必重新读取全部哈希
+    """
+
+    def __init__(self, db, logging, max_distance=None, action=None):
+        """
+        :param db: 异步数据库对象（AsyncImageDB）
+        :param logging: 日志记录器对象
+        :param max_distance: 最大汉明距离，默认读取环境变量 PHASH_DISTANCE
+        :param action: flag / skip，默认读取环境变量 PHASH_ACTION
+        """
+        self.db = db
+        self.logging = logging
+        self.max_distance = max_distance if max_distance is not None else int(os.getenv('PHASH_DISTANCE', 4))
+        self.action = (action or os.getenv('PHASH_ACTION', 'flag')).lower()
+        self.index = None
+
+    @staticmethod
+    def enabled():
+        return os.getenv('PHASH_ENABLED', 'true').lower() == 'true'
+
+    async def load(self):
+        """
+        获取进程内共用的哈希索引，首次使用时从数据库加载已有的哈希
+        """
+        with _index_lock:
+            self.index = _indexes.get(self.max_distance)
+        if self.index is not None:
+            return self
+        index = HashIndex(self.max_distance)
+        for pin_key, value in await self.db.load_hashes():
+            index.add(to_unsigned(value), pin_key)
+        with _index_lock:
+            # 并发加载时只保留先完成的索引
+            self.index = _indexes.setdefault(self.max_distance, index)
+        self.logging.info(f'已加载 {self.index.size} 个图片感知哈希')
+        return self
+
+    async def check(self, pin_key, value, paths):
+        """
+        检查图片是否与已采集的图片近似重复，并记录哈希
+        :param pin_key: 图片的 Pin 主键
+        :param value: 图片的 dHash
+        :param paths: 图片及其缩略图的路径，重复且 action 为 skip 时删除
+        :return: 重复时返回相似图片的 pin_key，否则返回 None
+        """
+        with _index_lock:
+            match = self.index.query(value)
+            if match is None:
+                self.index.add(value, pin_key)
+        if match is None or match[0] == pin_key:
+            await self.db.set_hash(pin_key, to_signed(value))
+            return None
+
+        duplicate_of, distance = match
+        await self.db.set_hash(pin_key, to_signed(value), duplicate_of)
+        if self.action == 'skip':
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            self.logging.info(f'图片 {os.path.basename(paths[0])} 与已采集图片 {duplicate_of} 近似重复'
+                              f'（距离 {distance}），已删除')
+        else:
+            self.logging.info(f'图片 {os.path.basename(paths[0])} 与已采集图片 {duplicate_of} 近似重复'
+                              f'（距离 {distance}）')
+        return duplicate_of
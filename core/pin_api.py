@@ -0,0 +1,157 @@
+import json
+import os
+
+from dotenv import load_dotenv
+
+# 加载.env文件中的环境变量
+load_dotenv()
+
+__all__ = ['PIN_RESOURCE_PATTERNS', 'extract_pins', 'extract_mode', 'PinResponseCollector']
+
+# 返回 Pin 列表数据的 Pinterest 资源接口（搜索、相关推荐、画板、首页信息流）
+PIN_RESOURCE_PATTERNS = (
+    'BaseSearchResource/get',
+    'SearchResource/get',
+    'RelatedModulesResource/get',
+    'RelatedPinFeedResource/get',
+    'BoardFeedResource/get',
+    'BoardContentRecommendationResource/get',
+    'UserHomefeedResource/get',
+)
+
+
+def _variants_from_images(images):
+    """
+    将 Pin 的 images 字段转换为按尺寸从小到大排序的图片规格列表
+    :param images: 形如 {"236x": {"url":..., "width":..., "height":...}, "orig": {...}} 的字典
+    :return: [{"url", "scale", "width", "height"}, ...]，最大尺寸在最后
+    """
+    variants = []
+    for scale, info in images.items():
+        if not isinstance(info, dict) or not info.get('url'):
+            continue
+        variants.append({
+            "url": info['url'],
+            "scale": scale,
+            "width": info.get('width'),
+            "height": info.get('height'),
+        })
+    # orig 始终视为最大尺寸
+    variants.sort(key=lambda v: (v['scale'] == 'orig', v['width'] or 0))
+    return variants
+
+
+def extract_pins(data):
+    """
+    从 Pinterest 资源接口的 JSON 中递归提取所有 Pin 的图片信息
+    :param data: 接口返回的 JSON 对象
+    :return: [{"pin_id", "variants"}, ...]
+    """
+    pins = []
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            images = node.get('images')
+            if isinstance(images, dict) and node.get('id') is not None:
+                variants = _variants_from_images(images)
+                if variants:
+                    pins.append({"pin_id": str(node['id']), "variants": variants})
+            stack.extend(v for v in node.values() if isinstance(v, (dict, list)))
+        elif isinstance(node, list):
+            stack.extend(v for v in node if isinstance(v, (dict, list)))
+    return pins
+
+
+class PinResponseCollector:
+    """
+    监听页面的 Pinterest 资源接口响应，直接从 JSON 中收集 Pin 图片信息，
+    不需要逐个查询 DOM 元素，也不会遗漏已经被虚拟列表移出 DOM 的 Pin
+    """
+
+    def __init__(self, logging, patterns=PIN_RESOURCE_PATTERNS):
+        """
+        :param logging: 日志记录器对象
+        :param patterns: 需要监听的接口 URL 片段
+        """
+        self.logging = logging
+        self.patterns = patterns
+        self._seen = set()
+        self._pending = []
+
+    def attach(self, page):
+        """
+        开始监听页面的网络响应
+        :param page: Playwright 页面对象
+        """
+        page.on('response', self._on_response)
+
+    def detach(self, page):
+        """
+        停止监听页面的网络响应
+        :param page: Playwright 页面对象
+        """
+        page.remove_listener('response', self._on_response)
+
+    def _add(self, pins, source):
+        new_count = 0
+        for pin in pins:
+            if pin['pin_id'] in self._seen:
+                continue
+            self._seen.add(pin['pin_id'])
+            self._pending.append(pin)
+            new_count += 1
+        if new_count:
+            self.logging.debug(f'从 {source} 收集到 {new_count} 个新的 Pin')
+
+    async def _on_response(self, response):
+        """
+        处理网络响应，从特定接口的 JSON 中提取 Pin
+        :param response: 网络响应对象
+        """
+        if not any(pattern in response.url for pattern in self.patterns):
+            return
+        if response.status != 200:
+            self.logging.debug(f'接口 {response.url} 返回状态码 {response.status}')
+            return
+        try:
+            data = await response.json()
+        except Exception as e:
+            # 页面跳转后响应体可能已被释放
+            self.logging.debug(f'读取接口响应失败: {e}')
+            return
+        self._add(extract_pins(data), response.url.split('?')[0])
+
+    async def harvest_initial_state(self, page):
+        """
+        首屏的 Pin 由服务端渲染在页面脚本中，不经过资源接口，需要单独解析
+        :param page: Playwright 页面对象
+        """
+        state = await page.evaluate("""() => {
+            const el = document.getElementById('__PWS_INITIAL_PROPS__') || document.getElementById('__PWS_DATA__');
+            return el ? el.textContent : null;
+        }""")
+        if not state:
+            self.logging.debug('页面中未找到初始数据脚本')
+            return
+        try:
+            self._add(extract_pins(json.loads(state)), 'initial state')
+        except ValueError as e:
+            self.logging.debug(f'解析页面初始数据失败: {e}')
+
+    def drain(self):
+        """
+        取出自上次调用以来收集到的新 Pin
+        :return: [{"pin_id", "variants"}, ...]
+        """
+        pins, self._pending = self._pending, []
+        return pins
+
+
+def extract_mode():
+    """
+    图片链接提取方式，读取环境变量 EXTRACT_MODE：
+    dom（遍历页面元素）、api（解析接口响应）、both（两者同时使用）
+    """
+    mode = os.getenv('EXTRACT_MODE', 'dom').lower()
+    return mode if mode in ('dom', 'api', 'both') else 'dom'
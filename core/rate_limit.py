@@ -0,0 +1,193 @@
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+# 加载.env文件中的环境变量
+load_dotenv()
+
+__all__ = ['TokenBucket', 'AdaptiveConcurrency', 'HostLimiter', 'HostRateLimiter', 'backoff_delay',
+           'retry_after_seconds']
+
+
+def backoff_delay(attempt, base=None, cap=None):
+    """
+    带随机抖动的指数退避时间（full jitter）：在 [0, min(cap, base * 2^attempt)] 中随机取值，
+    避免多个下载协程在同一时刻重试
+    :param attempt: 第几次重试（从 0 开始）
+    :param base: 基础等待时间（秒），默认读取环境变量 DOWNLOAD_BACKOFF_BASE
+    :param cap: 最长等待时间（秒），默认读取环境变量 DOWNLOAD_BACKOFF_MAX
+    """
+    base = base if base is not None else float(os.getenv('DOWNLOAD_BACKOFF_BASE', 0.5))
+    cap = cap if cap is not None else float(os.getenv('DOWNLOAD_BACKOFF_MAX', 30))
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_after_seconds(headers):
+    """
+    解析响应头中的 Retry-After（只支持秒数格式）
+    :return: 等待秒数，没有或无法解析时返回 None
+    """
+    value = headers.get('Retry-After') if headers else None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """
+    令牌桶限速：每秒补充 rate 个令牌，最多积累 burst 个，每个请求消耗一个令牌
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: 每秒请求数，小于等于 0 表示不限速
+        :param burst: 令牌桶容量（允许的突发请求数），默认等于 rate
+        """
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """
+        取得一个令牌，令牌不足时等待
+        """
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD 自适应并发：请求成功时并发上限缓慢增加（每轮约 +1），
+    遇到限流（429/5xx/超时）时上限减半，让并发稳定在服务器和代理能承受的最高水平
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None, decrease=0.5, cooldown=None):
+        """
+        :param initial: 初始并发上限
+        :param minimum: 最小并发上限
+        :param maximum: 最大并发上限
+        :param decrease: 限流时的乘性减小系数
+        :param cooldown: 两次减小之间的最短间隔（秒），同一波限流只减小一次；
+                         默认读取环境变量 DOWNLOAD_BACKOFF_COOLDOWN，未设置时使用平滑后的请求耗时（约一个往返）
+        """
+        self.minimum = minimum
+        self.maximum = maximum or max(initial, minimum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.decrease = decrease
+        if cooldown is None and os.getenv('DOWNLOAD_BACKOFF_COOLDOWN'):
+            cooldown = float(os.getenv('DOWNLOAD_BACKOFF_COOLDOWN'))
+        self.cooldown = cooldown
+        self.latency = 0.5
+        self.active = 0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.active < int(self.limit))
+            self.active += 1
+
+    async def release(self):
+        async with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def on_success(self, latency=None):
+        """
+        加性增加：每完成约 limit 个请求，上限增加 1
+        :param latency: 本次请求耗时（秒），用于估计减小上限的间隔
+        """
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        if latency is not None:
+            self.latency = 0.8 * self.latency + 0.2 * latency
+
+    def on_congestion(self):
+        """
+        乘性减小
+        :return: 是否实际减小了上限
+        """
+        now = time.monotonic()
+        cooldown = self.cooldown if self.cooldown is not None else self.latency
+        if now - self._last_decrease < cooldown:
+            return False
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.decrease)
+        return True
+
+
+class HostLimiter:
+    """
+    单个主机的下载限制：令牌桶限速 + AIMD 自适应并发
+    """
+
+    def __init__(self, host, rate, burst, initial, maximum):
+        self.host = host
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = AdaptiveConcurrency(initial, maximum=maximum)
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        占用一个下载名额：先等待并发名额，再取得令牌
+        :return: 请求开始时间，请求成功后传给 on_success
+        """
+        await self.concurrency.acquire()
+        try:
+            await self.bucket.acquire()
+            yield time.monotonic()
+        finally:
+            await self.concurrency.release()
+
+    def on_success(self, started=None):
+        """
+        :param started: slot() 返回的请求开始时间
+        """
+        self.concurrency.on_success(time.monotonic() - started if started is not None else None)
+
+    def on_congestion(self, logging=None):
+        if self.concurrency.on_congestion() and logging is not None:
+            logging.warning(f'{self.host} 出现限流或超时，并发上限降低为 {int(self.concurrency.limit)}')
+
+
+class HostRateLimiter:
+    """
+    按主机划分的下载限制器，参数读取环境变量：
+    DOWNLOAD_RATE_PER_HOST（每秒请求数）、DOWNLOAD_BURST（突发请求数）、
+    DOWNLOAD_INITIAL_CONCURRENCY（初始并发）、DOWNLOAD_LIMIT_PER_HOST（最大并发）
+    """
+
+    def __init__(self, rate=None, burst=None, initial=None, maximum=None):
+        self.rate = rate if rate is not None else float(os.getenv('DOWNLOAD_RATE_PER_HOST', 20))
+        self.burst = burst if burst is not None else float(os.getenv('DOWNLOAD_BURST', self.rate or 1))
+        self.initial = initial or int(os.getenv('DOWNLOAD_INITIAL_CONCURRENCY', 4))
+        self.maximum = maximum or int(os.getenv('DOWNLOAD_LIMIT_PER_HOST', 16))
+        self._hosts = {}
+
+    def for_host(self, host):
+        """
+        :param host: 主机名
+        :return: 该主机的 HostLimiter
+        """
+        limiter = self._hosts.get(host)
+        if limiter is None:
+            limiter = self._hosts[host] = HostLimiter(host, self.rate, self.burst, self.initial, self.maximum)
+        return limiter
@@ -0,0 +1,89 @@
+import os
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+# 加载.env文件中的环境变量
+load_dotenv()
+
+__all__ = ['ResultFeed', 'open_feed', 'get_feed']
+
+# 最近任务的结果流，按任务 ID 索引，只保留最近 RESULT_FEED_TASKS 个任务
+_feeds = OrderedDict()
+_feeds_lock = threading.Lock()
+
+
+class ResultFeed:
+    """
+    采集结果流：下载流水线每完成一张图片就发布一条结果，界面按偏移量读取新结果，
+    不需要在任务结束后扫描任务文件夹
+    """
+
+    def __init__(self):
+        self._items = []
+        self._cond = threading.Condition()
+        self.finished = False
+
+    def publish(self, image_path, preview_path=None):
+        """
+        发布一张已完成的图片
+        :param image_path: 原图路径
+        :param preview_path: 预览用的缩略图路径，默认使用原图
+        """
+        with self._cond:
+            self._items.append((image_path, preview_path or image_path))
+            self._cond.notify_all()
+
+    def close(self):
+        """
+        任务结束，不再有新结果
+        """
+        with self._cond:
+            self.finished = True
+            self._cond.notify_all()
+
+    def wait(self, offset, timeout=None):
+        """
+        等待 offset 之后出现新结果或任务结束
+        :return: 是否有新结果或任务已结束
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self._items) > offset or self.finished, timeout)
+
+    def read_since(self, offset):
+        """
+        :param offset: 上次读取返回的偏移量
+        :return: (新结果 [(原图路径, 预览路径), ...], 新的偏移量, 任务是否已结束)
+        """
+        with self._cond:
+            return self._items[offset:], len(self._items), self.finished
+
+    def snapshot(self, limit=None):
+        with self._cond:
+            return list(self._items[:limit] if limit is not None else self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+
+def open_feed(key):
+    """
+    创建任务的结果流，替换同一任务之前的结果流（断点续采时重新开始）
+    :param key: 任务 ID
+    """
+    with _feeds_lock:
+        _feeds.pop(key, None)
+        feed = _feeds[key] = ResultFeed()
+        while len(_feeds) > int(os.getenv('RESULT_FEED_TASKS', 20)):
+            _feeds.popitem(last=False)
+    return feed
+
+
+def get_feed(key):
+    """
+    :param key: 任务 ID
+    :return: 任务的结果流，任务尚未开始时返回 None
+    """
+    with _feeds_lock:
+        return _feeds.get(key)
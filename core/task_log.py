@@ -0,0 +1,170 @@
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from itertools import islice
+
+from dotenv import load_dotenv
+
+# 加载.env文件中的环境变量
+load_dotenv()
+
+__all__ = ['LogRingBuffer', 'create_task_logger', 'close_task_logger', 'read_task_log', 'get_service_logger']
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# 最近任务的内存日志，按任务文件夹索引，只保留最近 LOG_BUFFER_TASKS 个任务
+_buffers = OrderedDict()
+_buffers_lock = threading.Lock()
+_service_lock = threading.Lock()
+
+
+class LogRingBuffer:
+    """
+    环形日志缓冲区：保存最近 maxlen 行日志，每行有递增的序号，读取时只返回指定序号之后的新行
+    """
+
+    def __init__(self, maxlen=None):
+        """
+        :param maxlen: 保留的行数，默认读取环境变量 LOG_BUFFER_LINES
+        """
+        self._lines = deque(maxlen=maxlen or int(os.getenv('LOG_BUFFER_LINES', 2000)))
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def append(self, line):
+        with self._lock:
+            self._lines.append(line)
+            self._next += 1
+
+    def read_since(self, offset):
+        """
+        :param offset: 上次读取返回的序号
+        :return: (新的日志行, 下次读取的序号)；offset 之后的行已被覆盖时从最早保留的一行开始
+        """
+        with self._lock:
+            first = self._next - len(self._lines)
+            start = max(0, offset - first)
+            return list(islice(self._lines, start, None)), self._next
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    把格式化后的日志写入 LogRingBuffer
+    """
+
+    def __init__(self, buffer, level=logging.INFO):
+        super().__init__(level)
+        self.buffer = buffer
+
+    def emit(self, record):
+        try:
+            self.buffer.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+def create_task_logger(task_dir, log_file_path, level=None):
+    """
+    创建采集任务专用的日志记录器：写入任务文件夹下的日志文件和内存环形缓冲区，
+    不向根日志记录器传播，不同任务的日志互不混杂
+    :param task_dir: 任务文件夹
+    :param log_file_path: 日志文件路径
+    :param level: 日志级别，默认读取环境变量 LOG_LEVEL
+    :return: logging.Logger
+    """
+    # 不通过 logging.getLogger 注册，任务结束后日志记录器可以被回收
+    logger = logging.Logger(f'task.{os.path.basename(os.path.normpath(task_dir))}')
+    logger.setLevel(level or os.getenv('LOG_LEVEL', 'INFO'))
+    logger.propagate = False
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    file_handler = logging.FileHandler(log_file_path, encoding='utf-8')
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
+
+    with _buffers_lock:
+        buffer = _buffers.pop(task_dir, None) or LogRingBuffer()
+        _buffers[task_dir] = buffer
+        while len(_buffers) > int(os.getenv('LOG_BUFFER_TASKS', 20)):
+            _buffers.popitem(last=False)
+    buffer_handler = RingBufferHandler(buffer)
+    buffer_handler.setFormatter(formatter)
+    logger.addHandler(buffer_handler)
+    return logger
+
+
+def get_service_logger(level=None):
+    """
+    服务日志记录器：浏览器服务、任务调度、推理服务等不属于某个采集任务的日志，
+    输出到控制台和 SERVICE_LOG 文件（任务日志记录器不向根日志记录器传播，根日志记录器没有处理器）
+    :param level: 日志级别，默认读取环境变量 LOG_LEVEL
+    :return: logging.Logger
+    """
+    logger = logging.getLogger('pinterest.service')
+    with _service_lock:
+        if logger.handlers:
+            return logger
+        logger.setLevel(level or os.getenv('LOG_LEVEL', 'INFO'))
+        logger.propagate = False
+        formatter = logging.Formatter(LOG_FORMAT)
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(formatter)
+        logger.addHandler(stream_handler)
+        log_file_path = os.getenv('SERVICE_LOG', 'asset-local/service.log')
+        if log_file_path:
+            os.makedirs(os.path.dirname(log_file_path) or '.', exist_ok=True)
+            file_handler = logging.FileHandler(log_file_path, encoding='utf-8')
+            file_handler.setFormatter(formatter)
+            logger.addHandler(file_handler)
+    return logger
+
+
+def close_task_logger(logger):
+    """
+    关闭并移除任务日志记录器的所有处理器（内存缓冲区保留，供界面继续读取）
+    """
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+
+def _tail_file(log_file_path, offset):
+    """
+    从字节偏移量开始读取日志文件中新增的完整行
+    :return: (日志行, 新的偏移量)
+    """
+    if not os.path.exists(log_file_path):
+        return [], offset
+    with open(log_file_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() < offset:
+            offset = 0
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    text = data[:end].decode('utf-8', errors='replace')
+    return text.splitlines(), offset + end
+
+
+def read_task_log(task_dir, source=None, offset=0, log_name=None):
+    """
+    增量读取任务日志：任务在本进程中运行过时从内存缓冲区读取，否则按字节偏移量读取日志文件
+    :param task_dir: 任务文件夹
+    :param source: 上次读取的来源（memory / file），来源变化时从头读取
+    :param offset: 上次读取返回的偏移量
+    :param log_name: 日志文件名，默认读取环境变量 CRAWLER_LOG
+    :return: (新的日志行（不含 DEBUG）, 来源, 新的偏移量)
+    """
+    with _buffers_lock:
+        buffer = _buffers.get(task_dir)
+    current = 'memory' if buffer is not None else 'file'
+    if current != source:
+        offset = 0
+    if buffer is not None:
+        lines, offset = buffer.read_since(offset)
+    else:
+        log_file_path = os.path.join(task_dir, log_name or os.getenv('CRAWLER_LOG', 'crawler.log'))
+        lines, offset = _tail_file(log_file_path, offset)
+        lines = [line for line in lines if ' - DEBUG - ' not in line]
+    return lines, current, offset
@@ -0,0 +1,139 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+from dotenv import load_dotenv
+
+from core.phash import dhash
+
+# 加载.env文件中的环境变量
+load_dotenv()
+
+__all__ = ['IMAGE_EXTENSIONS', 'make_thumbnails', 'thumbnail_sizes', 'thumbnail_path', 'ThumbnailStage']
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+
+def thumbnail_sizes():
+    """
+    缩略图尺寸列表（最长边像素），第一个尺寸用于界面预览，读取环境变量 THUMBNAIL_SIZES
+    """
+    sizes = [int(size) for size in os.getenv('THUMBNAIL_SIZES', '256').split(',') if size.strip()]
+    return sizes or [256]
+
+
+def thumbnail_path(task_dir, image_name, size=None):
+    """
+    缩略图保存路径：<任务文件夹>/<THUMBNAIL_DIR>/<尺寸>/<图片名>
+    :param task_dir: 任务文件夹
+    :param image_name: 原图文件名
+    :param size: 缩略图尺寸，默认使用预览尺寸
+    """
+    size = size or thumbnail_sizes()[0]
+    return os.path.join(task_dir, os.getenv('THUMBNAIL_DIR', 'thumbnails'), str(size), image_name)
+
+
+def process_context():
+    """
+    进程池的启动方式：采集任务运行时进程中已有多个线程，fork 会继承其他线程持有的锁（如 logging），
+    子进程可能死锁，因此优先使用 forkserver，不支持时（Windows）使用 spawn
+    """
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method)
+
+
+def make_thumbnails(image_path, sizes, with_hash=False):
+    """
+    生成各尺寸的缩略图，并可同时计算感知哈希（在子进程中执行，图片只解码一次）；
+    不小于原图最长边的尺寸不生成缩略图，直接使用原图
+    :param image_path: 原图路径
+    :param sizes: 缩略图尺寸列表，可为空
+    :param with_hash: 是否计算 dHash
+    :return: {"thumbnails": {尺寸: 缩略图路径}, "dhash": 哈希值或 None}
+    """
+    task_dir, image_name = os.path.split(image_path)
+    outputs = {}
+    with Image.open(image_path) as image:
+        sizes = [size for size in sizes if size < max(image.size)]
+        # JPEG 按最大目标尺寸缩小解码，减少解码开销
+        draft_size = max(sizes) if sizes else 64
+        image.draft('RGB', (draft_size, draft_size))
+        image.load()
+        value = dhash(image) if with_hash else None
+        image_format = image.format
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        for size in sorted(sizes, reverse=True):
+            out_path = thumbnail_path(task_dir, image_name, size)
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            thumb = image.copy()
+            thumb.thumbnail((size, size))
+            tmp_path = f"{out_path}.part"
+            thumb.save(tmp_path, format=image_format, quality=85)
+            os.replace(tmp_path, out_path)
+            outputs[size] = out_path
+    return {"thumbnails": outputs, "dhash": value}
+
+
+class ThumbnailStage:
+    """
+    下载完成后的图片处理阶段：在进程池中生成缩略图、计算感知哈希，不占用事件循环和 GIL
+    """
+
+    def __init__(self, logging, workers=None, sizes=None, with_hash=False):
+        """
+        :param logging: 日志记录器对象
+        :param workers: 进程数，默认读取环境变量 THUMBNAIL_WORKERS
+        :param sizes: 缩略图尺寸列表，默认读取环境变量 THUMBNAIL_SIZES，THUMBNAIL_ENABLED 为 false 时不生成缩略图
+        :param with_hash: 是否同时计算 dHash
+        """
+        self.logging = logging
+        self.workers = workers or int(os.getenv('THUMBNAIL_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+        if sizes is None:
+            sizes = thumbnail_sizes() if self.enabled() else []
+        self.sizes = sizes
+        self.with_hash = with_hash
+        self._executor = None
+
+    @staticmethod
+    def enabled():
+        return os.getenv('THUMBNAIL_ENABLED', 'true').lower() == 'true'
+
+    def open(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=process_context())
+        return self
+
+    async def process(self, image_path):
+        """
+        生成缩略图并计算感知哈希
+        :param image_path: 原图路径
+        :return: {"thumbnails": {尺寸: 缩略图路径}, "dhash": 哈希值或 None}，失败时为空结果
+        """
+        result = {"thumbnails": {}, "dhash": None}
+        if not image_path.lower().endswith(IMAGE_EXTENSIONS):
+            return result
+        task_dir, image_name = os.path.split(image_path)
+        existing = {size: thumbnail_path(task_dir, image_name, size) for size in self.sizes}
+        if not self.with_hash and all(os.path.exists(path) for path in existing.values()):
+            return {"thumbnails": existing, "dhash": None}
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, make_thumbnails, image_path, self.sizes,
+                                              self.with_hash)
+        except Exception as e:
+            self.logging.error(f'处理图片失败 {os.path.basename(image_path)}: {e}')
+            return result
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def __aenter__(self):
+        return self.open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,28 +1,143 @@
+import asyncio
+import os
+
 import yaml
+from dotenv import load_dotenv
 
-from deepseek_janus_pro_7b.main import load_model, to_image_understanding
+from core.task_log import get_service_logger
+from core.verdict_cache import content_hash, get_verdict_cache, normalize_criteria
+from core.vision_service import get_vision_service
 
+# 加载.env文件中的环境变量
+load_dotenv()
 
-def image_understanding(image_path, require_element):
-    question = f"""
+__all__ = ['pick_question', 'score_question', 'parse_answer', 'image_understanding', 'image_understanding_batch',
+           'pick_images']
+
+
+def pick_question(require_element):
+    return f"""
        识别图片中是否 同时存在【 {require_element} 】元素：
        is_include 存在则为Y，不包含则为 N
-        
+
        # 返回格式如下
        ```yaml
        is_include: |
            Y或N
        ```
        """
-    # 模型初始化
-    model_path = "deepseek-ai/Janus-Pro-7B"
-    vl_chat_processor, vl_gpt, tokenizer = load_model(model_path)
 
-    # 图像分析
-    image = image_path  # 需要传入图像数据
-    ret = to_image_understanding(question, image, vl_chat_processor, vl_gpt, tokenizer)
 
-    yaml_str = ret.split("```yaml")[1].split("```")[0].strip()
-    analysis = yaml.safe_load(yaml_str)
+def score_question(require_element):
+    """
+    打分模式的问题：只看回答的第一个 token，要求直接回答 Y 或 N
+    """
+    return f"识别图片中是否 同时存在【 {require_element} 】元素，存在回答Y，不存在回答N，只回答一个字母。"
+
+
+def parse_answer(ret):
+    """
+    从模型回答中解析 Y 或 N，回答中没有 yaml 代码块时按原文判断
+    """
+    try:
+        yaml_str = ret.split("```yaml")[1].split("```")[0].strip()
+        analysis = yaml.safe_load(yaml_str)
+        return str(analysis['is_include']).strip()
+    except (IndexError, KeyError, TypeError, yaml.YAMLError):
+        return "Y" if "Y" in ret else "N"
+
+
+def pick_mode():
+    """
+    挑图模式，读取环境变量 PICK_MODE：score 一次前向计算比较 Y/N 的 logits（默认），generate 生成完整回答后解析
+    """
+    return os.getenv('PICK_MODE', 'score')
+
+
+def _submit(image_paths, require_element):
+    if pick_mode() == 'generate':
+        return get_vision_service(get_service_logger()).submit(pick_question(require_element), image_paths)
+    return get_vision_service(get_service_logger()).submit(score_question(require_element), image_paths, mode='score')
+
+
+def _cache_key(require_element):
+    """
+    :return: (规范化的挑图要求, 模型 ID)，模型 ID 包含挑图模式，两种模式的结果分开缓存
+    """
+    return normalize_criteria(require_element), f"{get_vision_service(get_service_logger()).model_id}:{pick_mode()}"
+
+
+def _lookup(image_paths, require_element):
+    """
+    查询挑图结果缓存
+    :return: (每张图片的内容哈希, 命中的结果 {内容哈希: (分数, 判定结果)}, 需要推理的图片 {内容哈希: 图片路径})；
+             内容相同的图片只推理一次
+    """
+    cache = get_verdict_cache()
+    if cache is None:
+        hashes = [None] * len(image_paths)
+        cached = {}
+    else:
+        hashes = [content_hash(image_path) for image_path in image_paths]
+        cached = cache.get_many(hashes, *_cache_key(require_element))
+    misses = {}
+    for image_path, key in zip(image_paths, hashes):
+        if key not in cached:
+            misses.setdefault(key or image_path, image_path)
+    return hashes, cached, misses
+
+
+def _resolve(image_paths, require_element, hashes, cached, misses, results, threshold=None):
+    """
+    合并缓存结果和推理结果，把推理结果写入缓存；打分模式按分数重新判定，调整阈值不需要重新推理
+    :return: [(Y 或 N, 分数), ...]，generate 模式的分数为 None
+    """
+    if pick_mode() == 'generate':
+        records = [(None, parse_answer(answer)) for answer in results]
+    else:
+        records = [(score, "Y" if score >= float(os.getenv('PICK_THRESHOLD', 0.5)) else "N") for score in results]
+    fresh = dict(zip(misses, records))
+    cache = get_verdict_cache()
+    if cache is not None:
+        # 无法计算内容哈希的图片（以路径作为键）不写入缓存
+        known = set(hashes)
+        cache.put_many([(key, score, verdict) for key, (score, verdict) in fresh.items() if key in known],
+                       *_cache_key(require_element))
+    threshold = threshold if threshold is not None else float(os.getenv('PICK_THRESHOLD', 0.5))
+    verdicts = []
+    for image_path, key in zip(image_paths, hashes):
+        score, verdict = cached.get(key) or fresh[key or image_path]
+        if score is not None:
+            verdict = "Y" if score >= threshold else "N"
+        verdicts.append((verdict, score))
+    return verdicts
+
+
+def image_understanding_batch(image_paths, require_element, threshold=None):
+    """
+    批量判断图片是否包含要求的元素（使用常驻推理服务，模型只加载一次）；
+    缓存中已有结果的图片直接返回，只把未命中的图片交给模型
+    :param threshold: 打分模式下判定为 Y 的最低分数，默认读取环境变量 PICK_THRESHOLD
+    :return: 每张图片的结果（Y 或 N）
+    """
+    hashes, cached, misses = _lookup(image_paths, require_element)
+    results = _submit(list(misses.values()), require_element).result()
+    return [verdict for verdict, _ in
+            _resolve(image_paths, require_element, hashes, cached, misses, results, threshold)]
+
+
+def image_understanding(image_path, require_element):
+    return image_understanding_batch([image_path], require_element)[0]
+
 
-    return str(analysis['is_include'])
\ No newline at end of file
+async def pick_images(image_paths, require_element, threshold=None):
+    """
+    在事件循环中批量挑图，查询缓存和等待推理结果时不阻塞事件循环
+    :param threshold: 打分模式下判定为 Y 的最低分数，默认读取环境变量 PICK_THRESHOLD
+    :return: [(图片路径, Y 或 N, 分数), ...]
+    """
+    hashes, cached, misses = await asyncio.to_thread(_lookup, image_paths, require_element)
+    results = await asyncio.wrap_future(_submit(list(misses.values()), require_element))
+    verdicts = await asyncio.to_thread(_resolve, image_paths, require_element, hashes, cached, misses, results,
+                                       threshold)
+    return [(image_path, verdict, score) for image_path, (verdict, score) in zip(image_paths, verdicts)]
@@ -0,0 +1,127 @@
+import hashlib
+import os
+import re
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from core.db_utils import DB_PATH, IN_CHUNK_SIZE, init_db
+
+# 加载.env文件中的环境变量
+load_dotenv()
+
+__all__ = ['VerdictCache', 'normalize_criteria', 'content_hash', 'get_verdict_cache']
+
+# 计算文件哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+# 挑图要求的分隔符：中英文逗号、顿号、分号和空白
+CRITERIA_SPLIT_RE = re.compile(r'[,，、;；\s]+')
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def normalize_criteria(require_element):
+    """
+    规范化挑图要求：拆分为元素后去重、排序（要求是"同时存在"，与元素顺序无关）
+    :param require_element: 逗号分隔的挑图要求，如 "美女、丝巾"
+    :return: 规范化后的字符串，如 "丝巾,美女"
+    """
+    elements = {element.lower() for element in CRITERIA_SPLIT_RE.split(require_element or '') if element}
+    return ','.join(sorted(elements))
+
+
+def content_hash(image_path):
+    """
+    图片内容哈希（与文件名和所在任务无关，同一张图片在不同任务中复用挑图结果）
+    :return: 十六进制哈希字符串，文件不存在时返回 None
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(image_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+class VerdictCache:
+    """
+    AI 挑图结果缓存：按 (图片内容哈希, 规范化的挑图要求, 模型 ID) 保存分数和判定结果，
+    超过 max_entries 条时删除最久未使用的记录
+    """
+
+    def __init__(self, db_path=DB_PATH, max_entries=None):
+        """
+        :param db_path: 数据库路径
+        :param max_entries: 最多保存的记录数，默认读取环境变量 PICK_CACHE_MAX_ENTRIES
+        """
+        self.conn = init_db(db_path, check_same_thread=False)
+        self.max_entries = max_entries or int(os.getenv('PICK_CACHE_MAX_ENTRIES', 200000))
+        self._lock = threading.Lock()
+
+    def get_many(self, hashes, criteria, model_id):
+        """
+        批量查询缓存，命中的记录更新最近使用时间
+        :param hashes: 图片内容哈希列表
+        :param criteria: 规范化的挑图要求
+        :param model_id: 模型 ID
+        :return: {内容哈希: (分数, 判定结果)}
+        """
+        hashes = list(dict.fromkeys(h for h in hashes if h))
+        found = {}
+        with self._lock, self.conn:
+            for i in range(0, len(hashes), IN_CHUNK_SIZE):
+                chunk = hashes[i:i + IN_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f'SELECT content_hash, score, verdict FROM pick_verdicts '
+                    f'WHERE criteria=? AND model_id=? AND content_hash IN ({placeholders})',
+                    (criteria, model_id, *chunk)).fetchall()
+                found.update((h, (score, verdict)) for h, score, verdict in rows)
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    'UPDATE pick_verdicts SET used_at=? WHERE content_hash=? AND criteria=? AND model_id=?',
+                    [(now, h, criteria, model_id) for h in found])
+        return found
+
+    def put_many(self, rows, criteria, model_id):
+        """
+        保存挑图结果，超出容量时淘汰最久未使用的记录
+        :param rows: [(内容哈希, 分数, 判定结果), ...]
+        """
+        rows = [row for row in rows if row[0]]
+        if not rows:
+            return
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO pick_verdicts (content_hash, criteria, model_id, score, verdict, used_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(h, criteria, model_id, score, verdict, now) for h, score, verdict in rows])
+            excess = self.conn.execute('SELECT COUNT(*) FROM pick_verdicts').fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.conn.execute(
+                    'DELETE FROM pick_verdicts WHERE (content_hash, criteria, model_id) IN '
+                    '(SELECT content_hash, criteria, model_id FROM pick_verdicts ORDER BY used_at LIMIT ?)',
+                    (excess,))
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def get_verdict_cache():
+    """
+    获取进程内共用的挑图结果缓存，PICK_CACHE=false 时返回 None
+    """
+    global _cache
+    if os.getenv('PICK_CACHE', 'true').lower() != 'true':
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = VerdictCache()
+        return _cache
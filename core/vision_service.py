@@ -0,0 +1,242 @@
+import importlib
+import os
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from dotenv import load_dotenv
+
+# 加载.env文件中的环境变量
+load_dotenv()
+
+__all__ = ['JanusBackend', 'StandInBackend', 'VisionService', 'load_backend', 'get_vision_service']
+
+# 打分时缓存前缀 KV 的问题数
+PREFIX_CACHE_SIZE = 4
+
+_service = None
+_service_lock = threading.Lock()
+
+
+class JanusBackend:
+    """
+    Janus-Pro 推理后端：模型只加载一次，按批次回答同一个问题，或一次前向计算给出 Y/N 分数
+    """
+
+    def __init__(self, model_path=None, device=None, max_new_tokens=None, temperature=None, prefix_cache=None):
+        """
+        :param model_path: 模型路径，默认读取环境变量 PICK_MODEL_PATH
+        :param device: 运行设备（cuda / cpu），默认读取环境变量 PICK_DEVICE，未设置时自动选择
+        :param max_new_tokens: 最多生成的 token 数，默认读取环境变量 PICK_MAX_NEW_TOKENS
+        :param temperature: 打分的校准温度，默认读取环境变量 PICK_SCORE_TEMPERATURE
+        :param prefix_cache: 打分时是否缓存问题前缀的 KV，默认读取环境变量 PICK_PREFIX_CACHE
+        """
+        self.model_path = model_path or os.getenv('PICK_MODEL_PATH', 'deepseek-ai/Janus-Pro-7B')
+        self.device = device or os.getenv('PICK_DEVICE') or None
+        self.max_new_tokens = max_new_tokens or int(os.getenv('PICK_MAX_NEW_TOKENS', 512))
+        self.temperature = temperature or float(os.getenv('PICK_SCORE_TEMPERATURE', 1.0))
+        if prefix_cache is None:
+            prefix_cache = os.getenv('PICK_PREFIX_CACHE', 'true').lower() == 'true'
+        self.model_id = self.model_path
+        self._model = None
+        # 问题前缀的 KV 缓存，只保留最近 PREFIX_CACHE_SIZE 个问题
+        self._prefix_cache = OrderedDict() if prefix_cache else None
+
+    def load(self):
+        # torch / janus 只在真正使用挑图时才导入
+        from deepseek_janus_pro_7b.main import load_model
+        if self._model is None:
+            self._model = load_model(self.model_path, self.device)
+        return self
+
+    def answer(self, question, image_paths):
+        """
+        :param question: 问题
+        :param image_paths: 一个批次的图片路径
+        :return: 每张图片的回答
+        """
+        from deepseek_janus_pro_7b.main import to_image_understanding_batch
+        vl_chat_processor, vl_gpt, tokenizer = self.load()._model
+        return to_image_understanding_batch(question, image_paths, vl_chat_processor, vl_gpt, tokenizer,
+                                            self.max_new_tokens)
+
+    def score(self, question, image_paths):
+        """
+        :param question: 只需回答 Y 或 N 的问题
+        :param image_paths: 一个批次的图片路径
+        :return: 每张图片回答 Y 的概率（0~1）
+        """
+        from deepseek_janus_pro_7b.main import score_yes_no_batch
+        vl_chat_processor, vl_gpt, tokenizer = self.load()._model
+        scores = score_yes_no_batch(question, image_paths, vl_chat_processor, vl_gpt, tokenizer,
+                                    prefix_cache=self._prefix_cache, temperature=self.temperature)
+        while self._prefix_cache is not None and len(self._prefix_cache) > PREFIX_CACHE_SIZE:
+            self._prefix_cache.popitem(last=False)
+        return scores
+
+
+class StandInBackend:
+    """
+    CPU 替身后端：不加载模型，每张图片都给出固定的分数，用于没有 GPU 的开发环境和测试；
+    calls 记录每次推理的图片数
+    """
+
+    model_id = 'stand-in'
+
+    def __init__(self, score=1.0):
+        """
+        :param score: 每张图片回答 Y 的概率，不小于 0.5 时回答 Y
+        """
+        self.fixed_score = score
+        self.calls = []
+
+    def load(self):
+        return self
+
+    def answer(self, question, image_paths):
+        self.calls.append(len(image_paths))
+        verdict = "Y" if self.fixed_score >= 0.5 else "N"
+        return [f"```yaml\nis_include: {verdict}\n```" for _ in image_paths]
+
+    def score(self, question, image_paths):
+        self.calls.append(len(image_paths))
+        return [self.fixed_score] * len(image_paths)
+
+
+def load_backend(name=None):
+    """
+    创建推理后端
+    :param name: 后端名称，默认读取环境变量 PICK_BACKEND；
+                 janus 表示 JanusBackend，stand-in 表示 StandInBackend，
+                 也可以是 "模块:工厂函数或类"（如测试用的小模型）
+    :return: 提供 load()、answer(question, image_paths) 和 score(question, image_paths) 的后端对象
+    """
+    name = name or os.getenv('PICK_BACKEND', 'janus')
+    if name == 'janus':
+        return JanusBackend()
+    if name == 'stand-in':
+        return StandInBackend()
+    module_name, _, attr = name.partition(':')
+    return getattr(importlib.import_module(module_name), attr)()
+
+
+class VisionService:
+    """
+    常驻推理服务：在独立线程中持有已加载的模型，把同一问题的请求合并为批次推理，
+    采集任务和界面通过 submit 提交图片，不会重复加载模型
+    """
+
+    def __init__(self, backend, logging, batch_size=None, batch_wait=None):
+        """
+        :param backend: 推理后端（见 load_backend）
+        :param logging: 日志记录器对象
+        :param batch_size: 每批最多的图片数，默认读取环境变量 PICK_BATCH_SIZE
+        :param batch_wait: 凑批时最多等待的秒数，默认读取环境变量 PICK_BATCH_WAIT
+        """
+        self.backend = backend
+        self.logging = logging
+        self.batch_size = batch_size or int(os.getenv('PICK_BATCH_SIZE', 8))
+        self.batch_wait = batch_wait if batch_wait is not None else float(os.getenv('PICK_BATCH_WAIT', 0.05))
+        self._queue = queue.Queue()
+        self._thread = None
+
+    @property
+    def model_id(self):
+        """
+        模型 ID（挑图结果缓存的键之一），后端没有 model_id 时使用类名
+        """
+        return getattr(self.backend, 'model_id', type(self.backend).__name__)
+
+    def start(self):
+        """
+        启动推理线程（重复调用无副作用），模型在推理线程中加载
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='vision-service', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def submit(self, question, image_paths, mode='answer'):
+        """
+        提交一组图片
+        :param question: 问题
+        :param image_paths: 图片路径列表
+        :param mode: answer 生成回答，score 一次前向计算给出回答 Y 的概率
+        :return: concurrent.futures.Future，结果为每张图片的回答或分数
+        """
+        self.start()
+        future = Future()
+        if not image_paths:
+            future.set_result([])
+            return future
+        self._queue.put(((mode, question), list(image_paths), future))
+        return future
+
+    def _collect(self, first):
+        """
+        取出队列中与第一个请求模式和问题都相同的请求，凑成不超过 batch_size 张图片的批次，
+        其他请求放回队列
+        """
+        requests = [first]
+        count = len(first[1])
+        others = []
+        while count < self.batch_size:
+            try:
+                item = self._queue.get(timeout=self.batch_wait)
+            except queue.Empty:
+                break
+            if item is None or item[0] != first[0]:
+                others.append(item)
+                break
+            requests.append(item)
+            count += len(item[1])
+        for item in others:
+            self._queue.put(item)
+        return requests
+
+    def _run(self):
+        try:
+            self.backend.load()
+            self.logging.info(f'推理服务已加载模型 {self.model_id}')
+        except Exception as e:
+            self.logging.error(f'推理服务加载模型失败: {e}')
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            requests = self._collect(item)
+            mode, question = item[0]
+            image_paths = [path for _, paths, _ in requests for path in paths]
+            answers = []
+            try:
+                infer = getattr(self.backend, mode)
+                for start in range(0, len(image_paths), self.batch_size):
+                    answers.extend(infer(question, image_paths[start:start + self.batch_size]))
+            except Exception as e:
+                self.logging.error(f'推理服务处理 {len(image_paths)} 张图片时出错: {e}')
+                for _, _, future in requests:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for _, paths, future in requests:
+                future.set_result(answers[offset:offset + len(paths)])
+                offset += len(paths)
+
+
+def get_vision_service(logging):
+    """
+    获取进程内共用的常驻推理服务（首次调用时创建并启动）
+    :param logging: 日志记录器对象
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = VisionService(load_backend(), logging).start()
+        return _service
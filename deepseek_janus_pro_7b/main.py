@@ -4,26 +4,34 @@ from janus.models import MultiModalityCausalLM, VLChatProcessor
 from janus.utils.io import load_pil_images
 
 
-def load_model(model_path):
-    """加载并初始化模型和处理器"""
+def load_model(model_path, device=None):
+    """
+    加载并初始化模型和处理器
+    :param device: 运行设备（cuda / cpu），默认有 GPU 时使用 cuda；CPU 上使用 float32
+    """
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
     vl_chat_processor = VLChatProcessor.from_pretrained(model_path)
     tokenizer = vl_chat_processor.tokenizer
 
     vl_gpt = AutoModelForCausalLM.from_pretrained(
         model_path, trust_remote_code=True
     )
-    vl_gpt = vl_gpt.to(torch.bfloat16).cuda().eval()
+    dtype = torch.bfloat16 if device.startswith("cuda") else torch.float32
+    vl_gpt = vl_gpt.to(dtype).to(device).eval()
 
     return vl_chat_processor, vl_gpt, tokenizer
 
 
-def to_image_understanding(question, image, vl_chat_processor, vl_gpt, tokenizer):
-    """分析图像并回答问题"""
-    # 创建对话结构
-    conversation = [
+def build_conversation(question, image, question_first=False):
+    """
+    单张图片的对话结构
+    :param question_first: 问题放在图片之前，同一问题的所有图片共享相同的前缀（可缓存前缀的 KV）
+    """
+    content = f"{question}\n<image_placeholder>" if question_first else f"<image_placeholder>\n{question}"
+    return [
         {
             "role": "<|User|>",
-            "content": f"<image_placeholder>\n{question}",
+            "content": content,
             "images": [image],
         },
         {
@@ -32,11 +40,120 @@ def to_image_understanding(question, image, vl_chat_processor, vl_gpt, tokenizer
         },
     ]
 
+
+def prepare_batch(question, images, vl_chat_processor, vl_gpt, question_first=False):
+    """
+    把多张图片和同一个问题处理为一个填充后的批次（左侧填充，attention_mask 屏蔽填充位置）
+    :return: BatchedVLChatProcessorOutput
+    """
+    prepares = []
+    for image in images:
+        conversation = build_conversation(question, image, question_first)
+        pil_images = load_pil_images(conversation)
+        prepares.append(vl_chat_processor(conversations=conversation, images=pil_images, force_batchify=False))
+    return vl_chat_processor.batchify(prepares).to(vl_gpt.device, dtype=vl_gpt.dtype)
+
+
+@torch.inference_mode()
+def to_image_understanding_batch(question, images, vl_chat_processor, vl_gpt, tokenizer, max_new_tokens=512):
+    """
+    批量分析多张图像并回答同一个问题，一次前向/生成处理整个批次
+    :param images: 图像路径列表
+    :return: 每张图像的回答
+    """
+    prepare_inputs = prepare_batch(question, images, vl_chat_processor, vl_gpt)
+    inputs_embeds = vl_gpt.prepare_inputs_embeds(**prepare_inputs)
+    outputs = vl_gpt.language_model.generate(
+        inputs_embeds=inputs_embeds,
+        attention_mask=prepare_inputs.attention_mask,
+        pad_token_id=tokenizer.eos_token_id,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        max_new_tokens=max_new_tokens,
+        do_sample=False,
+        use_cache=True
+    )
+    return [tokenizer.decode(output.cpu().tolist(), skip_special_tokens=True) for output in outputs]
+
+
+def answer_token_ids(tokenizer, answer):
+    """回答开头可能出现的 token（带或不带前导空格）"""
+    ids = {tokenizer.encode(text, add_special_tokens=False)[0] for text in (answer, f" {answer}")}
+    return sorted(ids)
+
+
+def _expand_cache(past_key_values, batch_size):
+    """把批次大小为 1 的前缀 KV 缓存扩展到整个批次（不复制数据）"""
+    legacy = past_key_values.to_legacy_cache() if hasattr(past_key_values, "to_legacy_cache") else past_key_values
+    expanded = tuple((key.expand(batch_size, -1, -1, -1), value.expand(batch_size, -1, -1, -1))
+                     for key, value in legacy)
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return type(past_key_values).from_legacy_cache(expanded)
+    return expanded
+
+
+def _prefix_length(input_ids, attention_mask, image_start_id):
+    """
+    批次中所有图片共享的前缀长度（第一个图片起始标记之前的部分）；
+    存在填充或前缀不一致时返回 0，不使用前缀缓存
+    """
+    if not bool(attention_mask.all()):
+        return 0
+    starts = (input_ids[0] == image_start_id).nonzero()
+    if len(starts) == 0:
+        return 0
+    length = int(starts[0])
+    if not bool((input_ids[:, :length] == input_ids[:1, :length]).all()):
+        return 0
+    return length
+
+
+@torch.inference_mode()
+def score_yes_no_batch(question, images, vl_chat_processor, vl_gpt, tokenizer, prefix_cache=None, temperature=1.0):
+    """
+    一次前向计算给多张图片打分：比较回答第一个 token 为 "Y" 和 "N" 的 logits，不做自回归生成
+    :param prefix_cache: 前缀 KV 缓存字典（可选），按问题缓存系统提示词和问题部分的 KV，同一问题的后续批次复用
+    :param temperature: 校准温度，分数为 sigmoid((logit_Y - logit_N) / temperature)
+    :return: 每张图片回答 "Y" 的概率（0~1）
+    """
+    prepare_inputs = prepare_batch(question, images, vl_chat_processor, vl_gpt, question_first=True)
+    inputs_embeds = vl_gpt.prepare_inputs_embeds(**prepare_inputs)
+    attention_mask = prepare_inputs.attention_mask
+    language_model = vl_gpt.language_model
+
+    prefix = 0
+    if prefix_cache is not None:
+        prefix = _prefix_length(prepare_inputs.input_ids, attention_mask, vl_chat_processor.image_start_id)
+    if prefix:
+        key = (question, prefix)
+        if key not in prefix_cache:
+            prefix_cache[key] = language_model(inputs_embeds=inputs_embeds[:1, :prefix],
+                                               use_cache=True).past_key_values
+        seq_len = inputs_embeds.shape[1]
+        position_ids = torch.arange(prefix, seq_len, device=inputs_embeds.device).unsqueeze(0)
+        outputs = language_model(inputs_embeds=inputs_embeds[:, prefix:], attention_mask=attention_mask,
+                                 past_key_values=_expand_cache(prefix_cache[key], len(images)),
+                                 position_ids=position_ids.expand(len(images), -1), use_cache=True)
+    else:
+        outputs = language_model(inputs_embeds=inputs_embeds, attention_mask=attention_mask, use_cache=False)
+
+    # 左侧填充，最后一个位置就是回答的第一个 token
+    logits = outputs.logits[:, -1, :].float()
+    yes = logits[:, answer_token_ids(tokenizer, "Y")].max(dim=-1).values
+    no = logits[:, answer_token_ids(tokenizer, "N")].max(dim=-1).values
+    return torch.sigmoid((yes - no) / temperature).cpu().tolist()
+
+
+def to_image_understanding(question, image, vl_chat_processor, vl_gpt, tokenizer):
+    """分析图像并回答问题"""
+    # 创建对话结构
+    conversation = build_conversation(question, image)
+
     # 处理输入数据
     pil_images = load_pil_images(conversation)
     prepare_inputs = vl_chat_processor(
         conversations=conversation, images=pil_images, force_batchify=True
-    ).to(vl_gpt.device)
+    ).to(vl_gpt.device, dtype=vl_gpt.dtype)
 
     # 生成回答
     inputs_embeds = vl_gpt.prepare_inputs_embeds(**prepare_inputs)
@@ -1,22 +1,51 @@
 import asyncio
+import atexit
 import json
-import logging
+import math
 import os
 import time
-import zipfile
-from datetime import datetime
+from urllib.parse import quote
 import gradio as gr
-from core import init_browser, close_browser, crawl_pinterest_page, init_db, close_db
+from core import crawl_pinterest_pages, AsyncImageDB
+from core.browser_service import BrowserService
+from core.catalog import TaskCatalog
+from core.db_utils import task_root
+from core.jobs import JobScheduler
+from core.packaging import package_folder, stream_zip
+from core.rate_limit import HostRateLimiter
+from core.results import ResultFeed, open_feed, get_feed
+from core.task_log import create_task_logger, close_task_logger, read_task_log, get_service_logger
+from core.downloader import DownloadPipeline
+from core.image_utils import ImageUtils
+from core.phash import NearDuplicateFilter
+from core.thumbnail import ThumbnailStage, thumbnail_path, IMAGE_EXTENSIONS
+from core.tools import pick_images
 from dotenv import load_dotenv
 import argparse
 
-# from core.tools import image_understanding
-
 # 加载.env文件中的环境变量
 load_dotenv()
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
+# 服务日志（浏览器服务、任务调度等），采集任务自身的日志写入任务文件夹
+service_logger = get_service_logger()
+
+# 常驻浏览器服务，所有采集任务共用同一个浏览器
+browser_service = BrowserService(service_logger)
+
+# 下载限速器，所有采集任务共用，按主机限速和自适应调整并发
+download_limiter = HostRateLimiter()
+
+# 任务状态显示名称
+JOB_STATUS_NAMES = {'queued': '排队中', 'running': '采集中', 'done': '已完成', 'failed': '失败', 'cancelled': '已取消'}
+
+# 任务目录（数据库中的 tasks 表），界面分页查询，不扫描任务文件夹
+task_catalog = TaskCatalog()
+
+# 图片方向筛选选项
+IMAGE_ORIENTATIONS = [("不限", ""), ("竖图", "portrait"), ("横图", "landscape"), ("方图", "square")]
+
 
 def get_crawler_cookie():
     """
@@ -38,90 +67,201 @@ def get_crawler_cookie():
 import shutil
 
 
-async def start_crawler(url, page_nums, require_element, overwrite_existing=True):
+def parse_urls(url):
+    """
+    解析输入的采集页面地址，支持多行或逗号分隔的多个 URL
+    :param url: 输入的字符串
+    :return: URL 列表（去重并保持顺序）
+    """
+    urls = [u.strip() for u in url.replace(',', '\n').replace('，', '\n').splitlines()]
+    return list(dict.fromkeys(u for u in urls if u))
+
+
+async def start_crawler(url, page_nums, require_element, overwrite_existing=True, progress=None, resume_dir=None,
+                        results=None, pick_filter=None):
     """
     主函数，负责执行 Pinterest 图片采集任务
-    :param url: Pinterest 采集页面的 URL 地址
+    :param url: Pinterest 采集页面的 URL 地址，多个地址按行分隔时并行采集
     :param page_nums: 需要采集的页面分页数量
-    :return: 返回采集到的图片列表，如果采集失败则返回 None
+    :param progress: 任务进度回调（JobProgress，可选）
+    :param resume_dir: 上次中断的任务文件夹，存在时从断点继续采集
+    :param results: 采集结果流（ResultFeed，可选），每下载完成一张图片发布一次，界面据此逐步显示预览
+    :param pick_filter: 挑图前按图片元数据预筛选的条件（可选），如 {"orientation": "portrait", "min_side": 1000}
+    :return: 返回采集到的图片预览列表，如果采集失败则返回 None
     """
-    # 生成任务ID并创建文件夹
-    task_id = time.strftime("%Y年%m月%d日%H时%M分%S秒", time.localtime(time.time()))
-    task_dir = os.path.join(current_dir, os.getenv("TASK_DIR", "tasks"), task_id)
+    resume = bool(resume_dir) and os.path.isdir(resume_dir)
+    if resume:
+        task_dir = resume_dir
+    else:
+        # 生成任务ID并创建文件夹
+        task_id = time.strftime("%Y年%m月%d日%H时%M分%S秒", time.localtime(time.time()))
+        task_dir = os.path.join(task_root(), task_id)
 
     os.makedirs(task_dir, exist_ok=True)
+    if progress is not None:
+        progress(task_dir=task_dir)
     # 设置日志文件路径
     log_file_path = os.path.join(task_dir, os.getenv("CRAWLER_LOG", "crawler.log"))
 
-    logger = logging.getLogger()
-    logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
-    file_handler = logging.FileHandler(log_file_path, encoding='utf-8')
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    # logging.basicConfig 仅在第一次调用时生效，后续调用会被忽略
-    # logging.basicConfig(filename=log_file_path, level=os.getenv("LOG_LEVEL", "INFO"),
-    #                     format='%(asctime)s - %(levelname)s - %(message)s', encoding='utf-8')
-    logging.debug(f"日志文件路径为：{log_file_path}")
-    logging.info("开始采集")
+    # 任务专用的日志记录器：只写入本任务的日志文件和内存缓冲区，任务结束后移除处理器
+    logger = create_task_logger(task_dir, log_file_path)
+    try:
+        return await run_crawler(logger, task_dir, resume, url, page_nums, require_element, overwrite_existing,
+                                 progress, results if results is not None else ResultFeed(), pick_filter)
+    finally:
+        close_task_logger(logger)
+
+
+async def pick_recognized_images(task_dir, images, require_element, logger, progress=None, pick_filter=None):
+    """
+    AI 挑图：把包含要求元素的图片放入任务文件夹下的 recognized_images
+    :param task_dir: 任务文件夹
+    :param images: 本次下载完成的图片路径
+    :param require_element: 挑图要求
+    :param logger: 任务日志记录器
+    :param progress: 进度回调（可选）
+    :param pick_filter: 按图片元数据预筛选的条件（见 image_filter，可选）
+    """
+    candidates = images
+    if pick_filter:
+        # 先按数据库中的图片元数据（方向、尺寸）预筛选，减少送入模型的图片
+        matched = {item['path'] for item in await asyncio.to_thread(task_catalog.images, task_dir, **pick_filter)}
+        candidates = [image for image in images if image in matched]
+        logger.info(f"按图片尺寸预筛选后剩余 {len(candidates)} / {len(images)} 张")
+    if progress is not None:
+        progress(message=f"AI 挑图中，共 {len(candidates)} 张")
+    for image_path, result, score in await pick_images(candidates, require_element):
+        score_text = f"（分数 {score:.3f}）" if score is not None else ""
+        logger.info(f"图片{image_path}：内容标识模型返回的结果为：{result}{score_text}")
+        if "Y" in result:
+            recognized_dir = os.path.join(task_dir, "recognized_images")
+            os.makedirs(recognized_dir, exist_ok=True)
+            # 构建新路径
+            recognized_path = os.path.join(recognized_dir, os.path.basename(image_path))
+            # 保留原文件：图片元数据、结果流和预览仍引用原路径；优先创建硬链接，不额外占用磁盘
+            if not os.path.exists(recognized_path):
+                try:
+                    os.link(image_path, recognized_path)
+                except OSError:
+                    shutil.copy2(image_path, recognized_path)
+
+
+async def run_crawler(logger, task_dir, resume, url, page_nums, require_element, overwrite_existing, progress,
+                      results, pick_filter=None):
+    """
+    执行采集任务，参数见 start_crawler
+    :param logger: 任务日志记录器
+    """
+    log_file_path = os.path.join(task_dir, os.getenv("CRAWLER_LOG", "crawler.log"))
+    logger.debug(f"日志文件路径为：{log_file_path}")
+    logger.info("开始采集")
 
     # 加载设置
     cookie_string = get_crawler_cookie()
     if not cookie_string or not url:
-        logging.info("请先设置 Cookie信息 和 数据采集URL ")
+        logger.info("请先设置 Cookie信息 和 数据采集URL ")
         return None
 
     # 初始化数据库
+    db = AsyncImageDB()
+    thumbnailer = None
+    status = 'done'
     try:
-        conn = init_db()
-        # 初始化浏览器
-        p, browser, context, page = await init_browser(logging)  # 接收async_playwright对象
-        logging.info("初始化浏览器完成")
-        # 爬取 Pinterest 页面
-        await crawl_pinterest_page(conn, page, logging, task_dir, url, page_nums, overwrite_existing)
-
-        # 关闭页面和上下文
-        await page.close()
-        await context.close()
-
-        # 关闭浏览器
-        await close_browser(p, browser, logging)  # 传递async_playwright对象
-
-        # 关闭数据库连接
-        close_db(conn)
-
-        # 读取并显示图片
-        image_dir = task_dir
-
-        if os.path.exists(image_dir):
-            images = [os.path.join(image_dir, f) for f in os.listdir(image_dir) if
-                      f.endswith(('.png', '.jpg', '.jpeg'))]
-            # 挑选图
-            # if require_element != '':
-            #     for image in images:
-            #         image_path = image
-            #         result = image_understanding(image_path, require_element)
-            #         logging.info(f"图片{image_path}：内容标识模型返回的结果为：{result}")
-            #         if "Y" in result:
-            #             recognized_dir = os.path.join(task_dir, "recognized_images")
-            #             os.makedirs(recognized_dir, exist_ok=True)
-            #             # 构建新路径
-            #             recognized_path = os.path.join(recognized_dir, os.path.basename(image_path))
-            #             # 移动文件（如果需要保留原文件，可改为 shutil.copy）
-            #             shutil.move(image_path, recognized_path)
-            if images:
-                logging.info(f"总计找到 {len(images)} 个图片 在 {os.path.basename(image_dir)}")
-                if len(images) < int(os.getenv("IMAGE_PRE_VIEW_NUMS")):
-                    return images
-                return images[:int(os.getenv("IMAGE_PRE_VIEW_NUMS"))]  # 返回任务目录和前10个图片
-        logging.warning("未找到图片")
-        # 挑选图
+        await db.open()
+        await db.add_task(task_dir, url)
+        # 断点续采：读取上次已处理的 Pin、未完成的下载和各页面的滚动进度
+        checkpoint = await db.load_checkpoint(task_dir) if resume else None
+        # 感知哈希近似重复过滤，索引包含所有任务中已采集的图片
+        dedup = await NearDuplicateFilter(db, logger).load() if NearDuplicateFilter.enabled() else None
+        # 下载完成后在进程池中生成缩略图、计算感知哈希
+        if ThumbnailStage.enabled() or dedup is not None:
+            thumbnailer = ThumbnailStage(logger, with_hash=dedup is not None).open()
+        # 爬取 Pinterest 页面，整个采集任务共用一个下载连接池，页面滚动与图片下载并行
+        async with ImageUtils(os.getenv("PROXY_URL"), limiter=download_limiter) as image_util:
+            async with DownloadPipeline(image_util, logger, thumbnailer=thumbnailer, dedup=dedup,
+                                        progress=progress, journal=db, results=results) as pipeline:
+                await crawl_pinterest_pages(db, browser_service, logger, task_dir, parse_urls(url), page_nums,
+                                            overwrite_existing, pipeline, checkpoint=checkpoint)
+    except asyncio.CancelledError:
+        status = 'cancelled'
+        raise
     except Exception as e:
-        logging.info(f"发生错误：{e}")
-
+        status = 'failed'
+        logger.error(f"发生错误：{e}")
+        raise
+    finally:
+        if thumbnailer is not None:
+            thumbnailer.close()
+        # 记录任务状态，提交剩余记录并关闭数据库连接（任务取消时也会执行）
+        if db.conn is not None:
+            await db.finish_task(task_dir, status)
+        await db.close()
+
+    # 本次下载完成的图片（由下载流水线发布，不再扫描任务文件夹）
+    published = results.snapshot()
+    images = [image for image, _ in published]
+    if images:
+        # 挑选图：所有图片一次提交给常驻推理服务，按批次推理
+        if require_element != '':
+            # 任务已记录为完成，挑图失败只记录错误，不影响已下载的结果
+            try:
+                await pick_recognized_images(task_dir, images, require_element, logger, progress, pick_filter)
+            except Exception as e:
+                logger.error(f"AI 挑图失败，已下载的图片不受影响：{e}")
+        logger.info(f"总计下载 {len(images)} 个图片 到 {os.path.basename(task_dir)}")
+        # 预览使用缩略图，避免浏览器加载原图
+        return [preview for _, preview in published[:int(os.getenv("IMAGE_PRE_VIEW_NUMS", 40))]]
+    logger.warning("未找到图片")
     return []
 
 
+def to_preview_path(image_path):
+    """
+    获取原图对应的预览缩略图路径
+    :param image_path: 原图路径
+    :return: 缩略图存在时返回缩略图路径，否则返回原图路径
+    """
+    thumb = thumbnail_path(os.path.dirname(image_path), os.path.basename(image_path))
+    return thumb if os.path.exists(thumb) else image_path
+
+
+def image_filter(orientation=None, min_side=None):
+    """
+    界面上的图片筛选条件
+    :param orientation: 图片方向（portrait / landscape / square，空表示不限）
+    :param min_side: 最短边的最小像素（0 或空表示不限）
+    :return: 筛选条件字典，没有条件时返回 None
+    """
+    conditions = {}
+    if orientation:
+        conditions["orientation"] = orientation
+    if min_side:
+        conditions["min_side"] = int(min_side)
+    return conditions or None
+
+
+def show_task_thumbnails(selected_paths, orientation=None, min_side=None):
+    """
+    预览选中任务文件夹中的图片（使用缩略图）
+    :param selected_paths: 选中的任务文件夹列表
+    :param orientation: 图片方向筛选（可选）
+    :param min_side: 最短边的最小像素（可选）
+    :return: 缩略图路径列表
+    """
+    if not selected_paths:
+        return []
+    folder = selected_paths[0]
+    if not os.path.isdir(folder):
+        folder = os.path.dirname(folder)
+    limit = int(os.getenv("IMAGE_PRE_VIEW_NUMS", 40))
+    conditions = image_filter(orientation, min_side)
+    if conditions:
+        # 按数据库中的图片元数据筛选，不打开图片文件
+        return [to_preview_path(item['path']) for item in task_catalog.images(folder, limit=limit, **conditions)]
+    images = sorted(f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+    return [to_preview_path(os.path.join(folder, f)) for f in images[:limit]]
+
+
 def find_available_port(start_port=7861):
     """
     查找可用的端口号
@@ -137,25 +277,127 @@ def find_available_port(start_port=7861):
         port += 1
 
 
-def execute_task(url, page_nums, require_element, overwrite_existing=True):
+async def run_crawl_job(params, progress):
+    """
+    任务调度器执行的采集任务
+    :param params: 任务参数（url、page_nums、require_element、overwrite_existing、pick_filter）
+    :param progress: 任务进度回调
+    :return: 任务结果说明
     """
-    执行采集任务并返回结果
+    # 结果流按任务 ID 登记，界面提交任务后即可读取，任务结束时关闭
+    results = open_feed(progress.job_id)
+    try:
+        images = await start_crawler(params['url'], params['page_nums'], params['require_element'],
+                                     params['overwrite_existing'], progress=progress, resume_dir=progress.task_dir,
+                                     results=results, pick_filter=params.get('pick_filter'))
+    finally:
+        results.close()
+    if images is None:
+        raise ValueError("请先设置 Cookie信息 和 数据采集URL")
+    return f"采集完成，预览 {len(images)} 张图片"
+
+
+# 采集任务调度器，在常驻浏览器服务的事件循环中运行，复用已启动的浏览器和预热的上下文
+job_scheduler = JobScheduler(run_crawl_job, browser_service, service_logger)
+
+
+def execute_task(url, page_nums, require_element, overwrite_existing=True, pick_orientation=None, pick_min_side=None):
+    """
+    校验参数并提交采集任务，任务在后台排队执行；提交后读取任务的结果流，
+    图片下载完成后分批推送到预览区，不等待整个任务结束
     :param url: Pinterest 采集页面的 URL 地址
     :param page_nums: 需要采集的页面分页数量
-    :return: 返回采集到的图片列表，如果 URL 格式不正确则返回 None
+    :param pick_orientation: 挑图前按图片方向预筛选（可选）
+    :param pick_min_side: 挑图前按最短边像素预筛选（可选）
+    :return: 生成器，逐次产生 (任务 ID, 提交结果说明, 图片预览列表)；如果 URL 格式不正确则不提交
     """
-    # 禁用按钮
-    image_button.interactive = False
     rule = ['www.pinterest.com', 'http']
-    for i in rule:
-        if i not in url:
-            gr.Warning("请输入正确的采集页面地址")
+    urls = parse_urls(url or '')
+    for u in urls or ['']:
+        for i in rule:
+            if i not in u:
+                gr.Warning("请输入正确的采集页面地址")
+                yield gr.update(), gr.update(), gr.update()
+                return
+    job_id = job_scheduler.submit({"url": url, "page_nums": page_nums, "require_element": require_element,
+                                   "overwrite_existing": overwrite_existing,
+                                   "pick_filter": image_filter(pick_orientation, pick_min_side)})
+    yield job_id, f"任务 #{job_id} 已加入队列", []
+
+    # 两次推送之间至少间隔 GALLERY_BATCH_INTERVAL 秒，期间完成的图片合并为一批
+    interval = float(os.getenv("GALLERY_BATCH_INTERVAL", 1))
+    poll_interval = float(os.getenv("JOB_POLL_INTERVAL", 2))
+    limit = int(os.getenv("IMAGE_PRE_VIEW_NUMS", 40))
+    previews, offset, feed = [], 0, None
+    while len(previews) < limit:
+        feed = feed or get_feed(job_id)
+        if feed is None:
+            # 任务还在排队；排队时被取消的任务不会产生结果流
+            job = job_scheduler.status(job_id)
+            if job is None or job['status'] in ('done', 'failed', 'cancelled'):
+                return
+            time.sleep(poll_interval)
+            continue
+        feed.wait(offset, timeout=poll_interval)
+        items, offset, finished = feed.read_since(offset)
+        if items:
+            previews.extend(preview for _, preview in items[:limit - len(previews)])
+            yield gr.update(), gr.update(), list(previews)
+        if finished:
             return
-        # 执行任务
-    result = asyncio.run(start_crawler(url, page_nums, require_element, overwrite_existing))
-    # 启用按钮
-    image_button.interactive = True
-    return result
+        time.sleep(interval)
+
+
+def cancel_task(job_id):
+    """
+    取消排队中或运行中的采集任务
+    :param job_id: 任务 ID
+    :return: 取消结果说明
+    """
+    if not job_id:
+        return "请输入任务ID"
+    if job_scheduler.cancel(int(job_id)):
+        return f"任务 #{int(job_id)} 已取消"
+    return f"任务 #{int(job_id)} 不存在或已结束"
+
+
+def resume_task(job_id):
+    """
+    从断点继续执行失败或已取消的采集任务
+    :param job_id: 任务 ID
+    :return: 结果说明
+    """
+    if not job_id:
+        return "请输入任务ID"
+    if job_scheduler.resume(int(job_id)):
+        return f"任务 #{int(job_id)} 已重新排队，将从断点继续"
+    return f"任务 #{int(job_id)} 不存在或不是失败/已取消状态"
+
+
+def describe_job(job):
+    """
+    任务状态说明文字
+    """
+    status = JOB_STATUS_NAMES.get(job['status'], job['status'])
+    text = f"任务 #{job['job_id']}：{status}，已下载 {job['done'] or 0} 张，失败 {job['failed'] or 0} 张"
+    if job['message']:
+        text += f"，{job['message']}"
+    return text
+
+
+def poll_jobs(job_id):
+    """
+    定时刷新任务列表和当前任务状态（图片预览由 execute_task 按结果流推送）
+    :param job_id: 当前界面提交的任务 ID
+    :return: (任务列表, 当前任务状态)
+    """
+    rows = [[job['job_id'], JOB_STATUS_NAMES.get(job['status'], job['status']), job['done'] or 0,
+             job['failed'] or 0, job['params'].get('url', ''), job['created_at'], job['message'] or '']
+            for job in job_scheduler.recent()]
+    job = job_scheduler.status(int(job_id)) if job_id else None
+    if job is None:
+        return rows, gr.update()
+    return rows, describe_job(job)
 
 
 # ====== 下面全是界面逻辑 ======
@@ -173,65 +415,40 @@ def save_crawler_settings(cookie_string):
     return "数据采集设置保存成功"
 
 
-def find_latest_task_dir(task_dir):
+def current_log_task_dir(job_id):
     """
-    找到 TASK_DIR 目录下时间最近的子文件夹
-    :param task_dir: 任务目录路径
-    :return: 最近的任务文件夹路径
+    日志窗口显示的任务文件夹：当前提交的任务，其次是最近的任务
     """
-    if not os.path.exists(task_dir):
-        return None
-
-    # 获取所有子文件夹
-    sub_dirs = [d for d in os.listdir(task_dir) if os.path.isdir(os.path.join(task_dir, d))]
-
-    # 解析文件夹名称并找到最近的一个
-    latest_dir = None
-    latest_time = None
-    for d in sub_dirs:
-        try:
-            # 解析文件夹名称（task_id）为时间戳
-            dir_time = datetime.strptime(d, "%Y年%m月%d日%H时%M分%S秒")
-            if latest_time is None or dir_time > latest_time:
-                latest_time = dir_time
-                latest_dir = d
-        except ValueError:
-            continue  # 忽略不符合格式的文件夹
-
-    if latest_dir:
-        return os.path.join(task_dir, latest_dir)
-    return None
-
-
-def read_crawler_logs():
-    """
-    读取并返回爬虫日志文件内容
-    :return: 包含 INFO 级别日志的字符串
-    """
-
-    latest_task_dir = find_latest_task_dir(os.path.join(current_dir, os.getenv("TASK_DIR")))
-    if not latest_task_dir:
-        return "无任务记录"
-
-    log_file_path = os.path.join(latest_task_dir, os.getenv("CRAWLER_LOG"))
-    # log_file_path = os.path.join(current_dir, os.getenv("CRAWLER_LOG", "crawler.log"))
-    if os.path.exists(log_file_path):
-        with open(log_file_path, 'r', encoding='utf-8') as f:
-            new_content = f.read()
-            if new_content:
-                info_logs = [line for line in new_content.splitlines() if 'INFO' in line]
-                return '\n'.join(info_logs)
-    else:
-        return "未找到日志文件"
+    job = job_scheduler.status(int(job_id)) if job_id else None
+    if job is None:
+        recent = job_scheduler.recent(1)
+        job = recent[0] if recent else None
+    if job is not None and job['task_dir']:
+        return job['task_dir']
+    task = task_catalog.latest()
+    return task['task_dir'] if task else None
 
 
-def refresh_file_explorer():
+def read_crawler_logs(job_id, log_state, log_text):
     """
-    刷新文件资源管理器
-    :return: 返回最新的文件列表
+    增量读取采集日志：只读取上次读取位置之后的新日志，日志窗口只保留最近 LOG_VIEW_LINES 行
+    :param job_id: 当前界面提交的任务 ID
+    :param log_state: 上次读取的 [任务文件夹, 来源, 偏移量]
+    :param log_text: 日志窗口当前内容
+    :return: (日志窗口内容, 新的读取状态)
     """
-    task_dir = os.path.join(current_dir, os.getenv("TASK_DIR", "tasks"))
-    return [os.path.join(task_dir, f) for f in os.listdir(task_dir)]
+    task_dir = current_log_task_dir(job_id)
+    if not task_dir:
+        return "无任务记录", None
+    if not log_state or log_state[0] != task_dir:
+        log_state, log_text = [task_dir, None, 0], ""
+    lines, source, offset = read_task_log(task_dir, log_state[1], log_state[2])
+    if source != log_state[1]:
+        log_text = ""
+    if lines:
+        view_lines = int(os.getenv("LOG_VIEW_LINES", 200))
+        log_text = "\n".join(((log_text.splitlines() if log_text else []) + lines)[-view_lines:])
+    return log_text, [task_dir, source, offset]
 
 
 def refresh_zip_files():
@@ -246,18 +463,100 @@ def refresh_zip_files():
     return [os.path.join(zip_path, f) for f in os.listdir(zip_path) if f.endswith('.zip')]
 
 
+def format_bytes(size):
+    """
+    字节数转换为易读的文字
+    """
+    size = float(size or 0)
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def load_task_page(page, status):
+    """
+    分页查询任务目录
+    :param page: 页码
+    :param status: 任务状态筛选，空字符串表示全部
+    :return: (任务列表, 本页任务文件夹列表, 分页说明, 实际页码)
+    """
+    page_size = int(os.getenv("TASK_PAGE_SIZE", 20))
+    total = task_catalog.count(status or None)
+    pages = max(1, math.ceil(total / page_size))
+    page = min(max(1, int(page or 1)), pages)
+    tasks = task_catalog.page(page, page_size, status or None)
+    rows = [[task['task_id'], JOB_STATUS_NAMES.get(task['status'], task['status']), task['image_count'] or 0,
+             format_bytes(task['bytes']), task['url'] or '', task['created_at'] or '', task['finished_at'] or '']
+            for task in tasks]
+    return rows, [task['task_dir'] for task in tasks], f"第 {page}/{pages} 页，共 {total} 个任务", page
+
+
+def select_task(page_task_dirs, evt: gr.SelectData):
+    """
+    选中任务列表中的一行
+    :return: 选中的任务文件夹列表（与打包、预览函数的参数格式一致）
+    """
+    row = evt.index[0] if isinstance(evt.index, (list, tuple)) else evt.index
+    if row is None or row >= len(page_task_dirs):
+        return []
+    return [page_task_dirs[row]]
+
+
 def zip_folder(folder_path, zip_path):
     """
-    将文件夹打包为 .zip 文件
+    将文件夹打包为 .zip 文件（图片直接存储不再压缩，文件夹未变化时复用已有的压缩包）
     :param folder_path: 文件夹路径
     :param zip_path: .zip 文件路径
     """
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                cname = os.path.relpath(str(file_path), str(folder_path))
-                zipf.write(str(file_path), cname)
+    return package_folder(folder_path, zip_path, service_logger)
+
+
+def resolve_task_folder(task_name):
+    """
+    根据任务文件夹名称找到 TASK_DIR 下的任务文件夹，不允许访问 TASK_DIR 以外的路径
+    :param task_name: 任务文件夹名称
+    :return: 任务文件夹路径，不存在时返回 None
+    """
+    root = task_root()
+    if not task_name or os.path.basename(task_name) != task_name or task_name in ('.', '..'):
+        return None
+    folder_path = os.path.join(root, task_name)
+    return folder_path if os.path.isdir(folder_path) else None
+
+
+def stream_task_archive(task_name: str):
+    """
+    边打包边下载任务文件夹，不在服务器上生成完整的压缩包
+    :param task_name: 任务文件夹名称
+    :return: StreamingResponse
+    """
+    from fastapi import HTTPException
+    from fastapi.responses import StreamingResponse
+
+    folder_path = resolve_task_folder(task_name)
+    if folder_path is None:
+        raise HTTPException(status_code=404, detail="任务文件夹不存在")
+    filename = quote(f"{task_name}.zip")
+    return StreamingResponse(stream_zip(folder_path), media_type="application/zip",
+                             headers={"Content-Disposition": f"attachment; filename*=UTF-8''{filename}"})
+
+
+def task_stream_link(folder_paths):
+    """
+    选中任务文件夹的流式下载链接
+    :param folder_paths: 选中的任务文件夹列表
+    :return: Markdown 链接
+    """
+    if not folder_paths:
+        return ""
+    folder = folder_paths[0]
+    if not os.path.isdir(folder):
+        folder = os.path.dirname(folder)
+    task_name = os.path.basename(folder)
+    if resolve_task_folder(task_name) is None:
+        return ""
+    return f"[直接下载 {task_name}.zip（边打包边下载）](download/{quote(task_name)})"
 
 
 def download_folder(folder_paths):
@@ -283,6 +582,12 @@ def download_folder(folder_paths):
 
 
 if __name__ == '__main__':
+    # 启动常驻浏览器，应用退出时关闭
+    browser_service.start()
+    atexit.register(browser_service.stop)
+    # 启动采集任务调度器，上次未完成的任务重新排队
+    job_scheduler.start()
+
     # 集成所有功能的 Gradio 界面
     # ====== 下面全是界面布局 ======
     with gr.Blocks(title="Pinterest") as app:
@@ -328,63 +633,106 @@ if __name__ == '__main__':
                         - https://www.pinterest.com/pin/1234567890
                         - https://www.pinterest.com
                         - https://www.pinterest.com/search/pins/?q=%E6%89%8B%E6%9C%BA&rs=rs&source_id=M9rKxgxg&eq=&etslf=820
-                - 点击【执行采集】按钮，开始采集
+                - 可输入多个地址（每行一个），多个页面将并行采集
+                - 点击【执行采集】按钮，任务加入队列后在后台执行，可连续提交多个任务
                 - 左侧可预览前{os.getenv("IMAGE_PRE_VIEW_NUMS")}张采集的图片
                 - 右侧可查看采集的日志""")
             with gr.Row():
-                pinterest_url = gr.Textbox(label="待采集页面URL地址", max_lines=1)
+                pinterest_url = gr.Textbox(label="待采集页面URL地址（每行一个）", lines=1, max_lines=10)
                 # 增加是否重复下载的checkbox
                 overwrite_existing = gr.Checkbox(label="是否重复下载", value=True)
                 collected_page_nums = gr.Number(label="页面采集分页数量(建议不要大于10,避免封锁账号或IP)", value=5)
             image_button = gr.Button("执行采集", interactive=True)  # 初始状态为可用
+            current_job = gr.State(None)
+            with gr.Row():
+                job_status = gr.Textbox(label="当前任务状态", interactive=False)
+                cancel_job_id = gr.Number(label="任务ID", precision=0)
+                cancel_button = gr.Button("取消任务")
+                resume_button = gr.Button("从断点继续")
             with gr.Row():
                 image_output = gr.Gallery(label="采集的图片", columns=10)
-                log_output = gr.Textbox(label="采集日志", value=read_crawler_logs, lines=10, max_lines=15,
-                                        every=5)  # 实时输出日志
+                log_output = gr.Textbox(label="采集日志", lines=10, max_lines=15)  # 实时输出日志
+            log_state = gr.State(None)
 
-            require_element = gr.Textbox(label="如果需要挑图，则输入的要求逗号分隔，建议包含人、产品主题，如：美女、丝巾",
-                                         max_lines=1, value='')
+            with gr.Row():
+                require_element = gr.Textbox(label="如果需要挑图，则输入的要求逗号分隔，建议包含人、产品主题，如：美女、丝巾",
+                                             max_lines=1, value='')
+                # 挑图前按图片元数据预筛选，不符合的图片不送入模型
+                pick_orientation = gr.Dropdown(label="挑图的图片方向", value="", choices=IMAGE_ORIENTATIONS)
+                pick_min_side = gr.Number(label="挑图的最短边(像素，0 表示不限)", value=0, precision=0)
+
+            job_table = gr.Dataframe(headers=["任务ID", "状态", "已下载", "失败", "采集地址", "提交时间", "说明"],
+                                     label="采集任务队列", interactive=False)
 
             image_button.click(
                 fn=execute_task,
-                inputs=[pinterest_url, collected_page_nums, require_element, overwrite_existing],
-                outputs=image_output
+                inputs=[pinterest_url, collected_page_nums, require_element, overwrite_existing, pick_orientation,
+                        pick_min_side],
+                outputs=[current_job, job_status, image_output],
+                # 推送预览时只占用本次会话，不阻塞其他用户提交任务
+                concurrency_limit=None
             )
+            current_job.change(lambda job_id: job_id, inputs=current_job, outputs=cancel_job_id)
+            cancel_button.click(fn=cancel_task, inputs=cancel_job_id, outputs=job_status)
+            resume_button.click(fn=resume_task, inputs=cancel_job_id, outputs=job_status)
+            # 定时轮询任务状态
+            job_timer = gr.Timer(float(os.getenv("JOB_POLL_INTERVAL", 2)))
+            job_timer.tick(fn=poll_jobs, inputs=current_job, outputs=[job_table, job_status])
+            # 定时增量读取日志
+            log_timer = gr.Timer(float(os.getenv("LOG_POLL_INTERVAL", 5)))
+            log_timer.tick(fn=read_crawler_logs, inputs=[current_job, log_state, log_output],
+                           outputs=[log_output, log_state])
 
         with gr.Tab("采集任务记录"):
-            gr.Markdown("可查看已经执行的所有采集任务下载素材，支持下载")
+            gr.Markdown("可查看已经执行的所有采集任务下载素材，支持下载；点击任务列表中的一行选中任务")
+            with gr.Row():
+                task_status_filter = gr.Dropdown(label="任务状态", value="",
+                                                 choices=[("全部", ""), ("采集中", "running"), ("已完成", "done"),
+                                                          ("失败", "failed"), ("已取消", "cancelled")])
+                task_page = gr.Number(label="页码", value=1, precision=0)
+                prev_page_btn = gr.Button("上一页")
+                next_page_btn = gr.Button("下一页")
+                refresh_btn = gr.Button("刷新任务目录")
+            task_page_info = gr.Markdown()
+            task_table = gr.Dataframe(headers=["任务", "状态", "图片数", "大小", "采集地址", "开始时间", "结束时间"],
+                                      label="采集任务记录", interactive=False)
+            page_task_dirs = gr.State([])
+            selected_task = gr.State([])
             with gr.Row():
-                with gr.Column():
-                    file_explorer = gr.FileExplorer(
-                        label="已经执行任务-执行记录文件夹（以执行开始时间命名）",
-                        glob="**/*",  # 匹配所有文件和文件夹
-                        root_dir=os.path.join(current_dir, os.getenv("TASK_DIR")),  # 设置根目录为 TASK_DIR
-                        every=1,
-                        height=300,
-                    )
-                    refresh_btn = gr.Button("刷新任务目录")
-
-
-                    def update_file_explorer():
-                        return gr.FileExplorer(root_dir="")
-
-
-                    def update_file_explorer_2():
-                        return gr.FileExplorer(root_dir=os.path.join(current_dir, os.getenv("TASK_DIR")))
-
-
-                    refresh_btn.click(update_file_explorer, outputs=file_explorer).then(update_file_explorer_2,
-                                                                                        outputs=file_explorer)
-
                 download_output = gr.File(label="已经完成打包,zip下载链接（已打包的可以直接下载）",
                                           value=refresh_zip_files,
                                           height=100,
                                           every=10)  # 实时刷新 .zip 文件列表
-            download_button = gr.Button("选中其中1个文件夹进行打包")
-
+            download_button = gr.Button("打包选中的任务")
+            stream_link = gr.Markdown()
+            with gr.Row():
+                gallery_orientation = gr.Dropdown(label="图片方向", value="", choices=IMAGE_ORIENTATIONS)
+                gallery_min_side = gr.Number(label="最短边(像素，0 表示不限)", value=0, precision=0)
+            task_gallery = gr.Gallery(label="选中任务的图片预览（缩略图）", columns=10)
+
+            task_page_outputs = [task_table, page_task_dirs, task_page_info, task_page]
+            app.load(load_task_page, inputs=[task_page, task_status_filter], outputs=task_page_outputs)
+            refresh_btn.click(load_task_page, inputs=[task_page, task_status_filter], outputs=task_page_outputs)
+            task_page.submit(load_task_page, inputs=[task_page, task_status_filter], outputs=task_page_outputs)
+            task_status_filter.change(lambda status: load_task_page(1, status), inputs=task_status_filter,
+                                      outputs=task_page_outputs)
+            prev_page_btn.click(lambda page, status: load_task_page((page or 1) - 1, status),
+                                inputs=[task_page, task_status_filter], outputs=task_page_outputs)
+            next_page_btn.click(lambda page, status: load_task_page((page or 1) + 1, status),
+                                inputs=[task_page, task_status_filter], outputs=task_page_outputs)
+            # 定时刷新当前页（只查询数据库中的一页任务）
+            task_timer = gr.Timer(float(os.getenv("TASK_POLL_INTERVAL", 10)))
+            task_timer.tick(load_task_page, inputs=[task_page, task_status_filter], outputs=task_page_outputs)
+
+            task_table.select(select_task, inputs=page_task_dirs, outputs=selected_task)
+            gallery_inputs = [selected_task, gallery_orientation, gallery_min_side]
+            selected_task.change(fn=show_task_thumbnails, inputs=gallery_inputs, outputs=task_gallery)
+            gallery_orientation.change(fn=show_task_thumbnails, inputs=gallery_inputs, outputs=task_gallery)
+            gallery_min_side.submit(fn=show_task_thumbnails, inputs=gallery_inputs, outputs=task_gallery)
+            selected_task.change(fn=task_stream_link, inputs=selected_task, outputs=stream_link)
             download_button.click(
                 fn=download_folder,  # 调用下载函数
-                inputs=file_explorer,  # 获取选中的文件夹路径
+                inputs=selected_task,  # 获取选中的任务文件夹
                 outputs=download_output  # 提供下载链接
             )
 
@@ -398,12 +746,18 @@ if __name__ == '__main__':
                        allowed_paths=[os.getenv('ROOT', ''), os.getenv('ZIP_DIR', ''), os.getenv('TASK_DIR', ''), "tmp",
                                       os.path.join(os.getcwd(), 'Log')],
                        server_port=args.port, favicon_path="favicon.ico", ssl_certfile="cert.pem",
-                       ssl_keyfile="key.pem", root_path="/pinterest-plugin")
+                       ssl_keyfile="key.pem", root_path="/pinterest-plugin", prevent_thread_lock=True)
         elif os.getenv('PLATFORM', '') == 'server':
             app.launch(share=False, server_name="0.0.0.0", ssl_verify=False,
                        allowed_paths=[os.getenv('ROOT', ''), os.getenv('ZIP_DIR', ''), os.getenv('TASK_DIR', ''), "tmp",
                                       os.path.join(os.getcwd(), 'Log')],
                        server_port=args.port, favicon_path="favicon.ico", ssl_certfile="cert.pem",
-                       ssl_keyfile="key.pem", root_path="/pinterest-plugin")
+                       ssl_keyfile="key.pem", root_path="/pinterest-plugin", prevent_thread_lock=True)
+
+        if os.getenv('PLATFORM', '') in ('local', 'server'):
+            # 任务文件夹流式打包下载接口，放在 Gradio 路由之前
+            app.app.add_api_route("/download/{task_name}", stream_task_archive, methods=["GET"])
+            app.app.router.routes.insert(0, app.app.router.routes.pop())
+            app.block_thread()
 
         # app.launch(share=False, allowed_paths=[os.getenv("TASK_DIR", "tasks")], server_port=args.port)
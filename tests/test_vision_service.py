@@ -0,0 +1,61 @@
+import logging
+
+import pytest
+
+import core.verdict_cache as verdict_cache
+import core.vision_service as vision_service
+from core.tools import image_understanding_batch
+from core.verdict_cache import VerdictCache
+from core.vision_service import StandInBackend, VisionService, load_backend
+
+
+@pytest.fixture
+def service(monkeypatch, tmp_path):
+    """
+    使用 CPU 替身后端的推理服务（每批 4 张）和临时的挑图结果缓存
+    """
+    monkeypatch.setenv('PICK_MODE', 'score')
+    monkeypatch.setenv('PICK_CACHE', 'true')
+    monkeypatch.setenv('SERVICE_LOG', str(tmp_path / 'service.log'))
+    backend = StandInBackend()
+    svc = VisionService(backend, logging.getLogger(__name__), batch_size=4, batch_wait=0).start()
+    cache = VerdictCache(str(tmp_path / 'cache.db'))
+    monkeypatch.setattr(vision_service, '_service', svc)
+    monkeypatch.setattr(verdict_cache, '_cache', cache)
+    yield svc
+    svc.stop()
+    cache.close()
+
+
+def make_images(tmp_path, count):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f'{i}.jpg'
+        path.write_bytes(f'image-{i}'.encode())
+        paths.append(str(path))
+    return paths
+
+
+def test_load_backend_stand_in():
+    assert isinstance(load_backend('stand-in'), StandInBackend)
+    assert isinstance(load_backend('core.vision_service:StandInBackend'), StandInBackend)
+
+
+def test_batch_split_by_batch_size(service):
+    assert service.submit('q', ['a', 'b', 'c', 'd', 'e'], mode='score').result(timeout=5) == [1.0] * 5
+    assert service.backend.calls == [4, 1]
+
+
+def test_cached_verdicts_skip_inference(service, tmp_path):
+    paths = make_images(tmp_path, 5)
+    assert image_understanding_batch(paths, '猫、狗') == ['Y'] * 5
+    assert service.backend.calls == [4, 1]
+
+    # 同样的图片和要求（元素顺序不同）直接命中缓存，不再推理
+    assert image_understanding_batch(paths, '狗，猫') == ['Y'] * 5
+    assert service.backend.calls == [4, 1]
+
+    # 只有未缓存的图片送入模型
+    paths = make_images(tmp_path, 6)
+    assert image_understanding_batch(paths, '猫、狗') == ['Y'] * 6
+    assert service.backend.calls == [4, 1, 1]